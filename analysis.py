@@ -0,0 +1,356 @@
+import contextvars
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from artifacts import estimate_tokens
+from chains import MODEL_NAME, TEMPERATURE
+from corpus import get_data_path, get_master_document
+from report_cache import report_key
+from retrieval import format_sections, retrieve_sections, tokenize
+from scheduler import llm_scheduler
+from structure import cited_sections, get_act_index
+from tokens import SYSTEM_PROMPTS, usage_config
+from tracing import span
+
+# Size of each uploaded-document section sent in one map call
+SECTION_SIZE = 12000
+# A line ends a section when its hash is divisible by this (once the section is half full),
+# so section boundaries follow the text rather than character offsets
+SECTION_CUT_DIVISOR = 32
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "4"))
+# Legislation sections retrieved for each document section
+LEGISLATION_TOP_K = 8
+# Term overlap (Jaccard) above which two areas' compliance risks are reported once
+CROSS_AREA_SIMILARITY = 0.6
+
+REPORT_HEADINGS = ["Aligned Provisions", "Gaps/Discrepancies", "Compliance Risks", "Recommendations"]
+NONE_PATTERN = re.compile(r"^[-*\d.\s]*(none identified|n/a|none)\.?$", re.IGNORECASE)
+BULLET_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+SEVERITY_PATTERN = re.compile(r"\b(high|medium|low)\b", re.IGNORECASE)
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?;:])(?=\s)")
+
+
+class AnalysisStopped(Exception):
+    """Raised when a sectioned analysis is stopped before all its sections were sent."""
+
+
+def _heading_of(line):
+    """Return the report heading a markdown line introduces, if any."""
+    stripped = line.strip().strip("#*: ").lower()
+    for heading in REPORT_HEADINGS:
+        if stripped.startswith(heading.split("/")[0].lower()) and len(stripped) <= len(heading) + 3:
+            return heading
+    return None
+
+
+def _units(document_content, section_size):
+    """Lines of the document, with any line longer than a section split at sentence ends."""
+    for line in document_content.splitlines(keepends=True):
+        if len(line) <= section_size:
+            yield line
+            continue
+        for sentence in SENTENCE_PATTERN.split(line):
+            for start in range(0, len(sentence), section_size):
+                yield sentence[start:start + section_size]
+
+
+def _is_cut(line):
+    if not line.strip():
+        return False
+    digest = hashlib.blake2b(line.strip().encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "big") % SECTION_CUT_DIVISOR == 0
+
+
+def split_document(document_content, section_size=SECTION_SIZE):
+    """Split an uploaded document into sections for the map step.
+
+    Boundaries are content-defined: a section ends after a line chosen by
+    its hash (once the section is at least half ``section_size``), or
+    before it would exceed ``section_size``. Editing one paragraph of a
+    revised document therefore changes only the sections around it.
+    """
+    sections, current, size = [], [], 0
+    for unit in _units(document_content, section_size):
+        if current and size + len(unit) > section_size:
+            sections.append("".join(current))
+            current, size = [], 0
+        current.append(unit)
+        size += len(unit)
+        if size >= section_size // 2 and _is_cut(unit):
+            sections.append("".join(current))
+            current, size = [], 0
+    if current:
+        sections.append("".join(current))
+    return [section for section in sections if section.strip()]
+
+
+def section_key(section, master_version):
+    """Cache key for one section's findings against one version of the legislation."""
+    return report_key(hashlib.sha256(section.encode("utf-8")).hexdigest(), master_version,
+                      SYSTEM_PROMPTS["section"], MODEL_NAME, TEMPERATURE, mode="section")
+
+
+def changed_sections(document_content, data_path, findings_cache):
+    """(changed, total): how many sections have no stored findings for the current legislation."""
+    version = get_master_document(data_path).version
+    keys = [section_key(section, version) for section in split_document(document_content)]
+    return sum(key not in findings_cache for key in keys), len(keys)
+
+
+def parse_findings(text):
+    """Split one section's findings into {heading: [finding, ...]}."""
+    findings = {heading: [] for heading in REPORT_HEADINGS}
+    current = None
+    for line in text.splitlines():
+        heading = _heading_of(line)
+        if heading:
+            current = heading
+            continue
+        if current is None or not line.strip() or NONE_PATTERN.match(line.strip()):
+            continue
+        if BULLET_PATTERN.match(line) or not findings[current]:
+            findings[current].append(BULLET_PATTERN.sub("", line).strip())
+        else:
+            # Continuation of the previous finding
+            findings[current][-1] += " " + line.strip()
+    return findings
+
+
+def collect_findings(section_findings):
+    """{heading: [(section label, finding), ...]} with repeated findings dropped."""
+    merged = {heading: [] for heading in REPORT_HEADINGS}
+    seen = set()
+    for label, findings in section_findings:
+        for heading in REPORT_HEADINGS:
+            for finding in findings.get(heading, []):
+                key = (heading, re.sub(r"\W+", " ", finding.lower()).strip())
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged[heading].append((label, finding))
+    return merged
+
+
+def _source(label, finding, act_index):
+    cited = cited_sections(finding, act_index) if act_index is not None else []
+    return f"document section {label}" + (f"; legislation {', '.join(cited)}" if cited else "")
+
+
+def _finding_lines(merged, act_index, level="##", skip=(), skip_note=None):
+    lines = []
+    for heading in REPORT_HEADINGS:
+        lines.append(f"{level} {heading}")
+        items = [(label, finding) for label, finding in merged[heading] if (heading, finding) not in skip]
+        skipped = len(merged[heading]) - len(items)
+        if not items and not skipped:
+            lines.append("None identified.")
+        for i, (label, finding) in enumerate(items, 1):
+            marker = f"{i}." if heading == "Recommendations" else "-"
+            lines.append(f"{marker} {finding} _({_source(label, finding, act_index)})_")
+        if skipped and skip_note:
+            lines.append(skip_note.format(count=skipped))
+        lines.append("")
+    return lines
+
+
+def _conclusion(merged, sections):
+    severities = [m.group(1).capitalize() for _, f in merged["Compliance Risks"]
+                  for m in [SEVERITY_PATTERN.search(f)] if m]
+    counts = ", ".join(f"{severities.count(s)} {s.lower()}" for s in ("High", "Medium", "Low") if s in severities)
+    return (
+        f"Reviewed {sections} document section(s): {len(merged['Aligned Provisions'])} aligned provision(s), "
+        f"{len(merged['Gaps/Discrepancies'])} gap(s) and {len(merged['Compliance Risks'])} compliance risk(s)"
+        + (f" ({counts} severity)" if counts else "")
+        + f". {len(merged['Recommendations'])} recommendation(s) should be actioned"
+        + (", starting with the high-severity risks." if "High" in severities else ".")
+    )
+
+
+def merge_findings(section_findings, act_index=None):
+    """Merge per-section findings (in document order) into the report format.
+
+    With an ``act_index``, each finding is also tagged with the act sections it cites.
+    """
+    merged = collect_findings(section_findings)
+    lines = ["# Compliance Report", ""] + _finding_lines(merged, act_index)
+    lines.append("## Conclusion")
+    lines.append(_conclusion(merged, len(section_findings)))
+    return "\n".join(lines)
+
+
+def _similarity(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _risk_terms(finding):
+    # Severity is compared separately, so "X (high)" and "X (medium)" count as the same risk
+    return {t for t in tokenize(finding) if t not in ("high", "medium", "low", "severity", "risk")}
+
+
+def _severity_rank(finding):
+    m = SEVERITY_PATTERN.search(finding)
+    return ("low", "medium", "high").index(m.group(1).lower()) + 1 if m else 0
+
+
+def shared_risks(area_merged):
+    """Group compliance risks that several areas raised in near-identical words.
+
+    ``area_merged`` is [(area, collected findings)]; returns
+    [[(area, label, finding), ...]] for groups spanning two or more areas.
+    """
+    groups = []
+    for area, merged in area_merged:
+        for label, finding in merged["Compliance Risks"]:
+            terms = _risk_terms(finding)
+            for group_terms, members in groups:
+                if _similarity(terms, group_terms) >= CROSS_AREA_SIMILARITY:
+                    members.append((area, label, finding))
+                    break
+            else:
+                groups.append((terms, [(area, label, finding)]))
+    return [members for _, members in groups if len({area for area, _, _ in members}) > 1]
+
+
+def merge_areas(area_results):
+    """Combine per-area section findings into one report.
+
+    ``area_results`` is [(area, section_findings, act_index)]. Risks raised
+    by more than one area are listed once (at the highest severity given)
+    under "Cross-Area Compliance Risks", and left out of the per-area lists.
+    """
+    area_merged = [(area, collect_findings(section_findings)) for area, section_findings, _ in area_results]
+    act_indexes = {area: act_index for area, _, act_index in area_results}
+    sections = {area: len(section_findings) for area, section_findings, _ in area_results}
+    shared = shared_risks(area_merged)
+
+    lines = ["# Multi-Area Compliance Report", "",
+             f"Policy areas: {', '.join(area for area, _ in area_merged)}", "",
+             "## Cross-Area Compliance Risks"]
+    if not shared:
+        lines.append("None identified.")
+    for members in shared:
+        finding = max((text for _, _, text in members), key=_severity_rank)
+        sources = []
+        for area in dict.fromkeys(area for area, _, _ in members):
+            labels = ", ".join(str(label) for member_area, label, _ in members if member_area == area)
+            cited = sorted({c for member_area, _, text in members if member_area == area
+                            for c in cited_sections(text, act_indexes[area])})
+            sources.append(f"{area}: document section(s) {labels}" + (f"; legislation {', '.join(cited)}" if cited else ""))
+        lines.append(f"- {finding} _({'; '.join(sources)})_")
+    lines.append("")
+
+    for area, merged in area_merged:
+        skip = {("Compliance Risks", text) for members in shared for member_area, _, text in members
+                if member_area == area}
+        lines.append(f"## {area}")
+        lines.extend(_finding_lines(merged, act_indexes[area], level="###", skip=skip,
+                                    skip_note="_{count} shared with other areas; see Cross-Area Compliance Risks._"))
+        lines.append("### Conclusion")
+        lines.append(_conclusion(merged, sections[area]))
+        lines.append("")
+
+    lines.append("## Overall Conclusion")
+    lines.append(
+        f"Checked against {len(area_merged)} policy area(s): "
+        + "; ".join(f"{area} {len(merged['Compliance Risks'])} risk(s)" for area, merged in area_merged)
+        + f". {len(shared)} risk(s) apply across more than one area and should be addressed first."
+    )
+    return "\n".join(lines)
+
+
+def section_findings(section_chain, sections, data_path, max_concurrency=ANALYSIS_MAX_CONCURRENCY,
+                     progress=None, max_retries=5, area=None, findings_cache=None, stop=None):
+    """Map step: [(section number, findings)] for already split ``sections``, in document order.
+
+    Each section is checked against the legislation sections most relevant
+    to it, with at most ``max_concurrency`` calls in flight; every call goes
+    through the shared LLM scheduler. ``progress(done, total)`` is called as
+    sections finish. With a ``findings_cache``, each section's findings are
+    stored under its content hash, and sections already there are not sent.
+    Once ``stop`` (a threading.Event) is set, no further calls are made and
+    AnalysisStopped is raised.
+    """
+    total = len(sections)
+    version = get_master_document(data_path).version
+    keys = [section_key(section, version) for section in sections]
+
+    def run(i, section):
+        if stop is not None and stop.is_set():
+            raise AnalysisStopped(f"stopped before section {i} of {total}")
+        legislation = format_sections(retrieve_sections(data_path, section, k=LEGISLATION_TOP_K))
+        inputs = {"company_policy": legislation, "section_label": f"{i} of {total}", "document_content": section}
+        with span("llm.section", section=i, area=area):
+            output = llm_scheduler.call(lambda: section_chain.invoke(inputs, config=usage_config(area, "section")),
+                                        tokens=estimate_tokens(legislation + section), max_retries=max_retries)
+        return i, parse_findings(output)
+
+    results = {}
+    if findings_cache is not None:
+        for i, key in enumerate(keys, 1):
+            stored = findings_cache.get(key)
+            if stored is not None:
+                results[i] = json.loads(stored)
+        if progress:
+            progress(len(results), total)
+
+    with span("analysis.sections", area=area, total=total, reused=len(results)):
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            # Each worker thread runs in a copy of this context so its spans join the caller's trace
+            futures = [pool.submit(contextvars.copy_context().run, run, i, section)
+                       for i, section in enumerate(sections, 1) if i not in results]
+            for future in as_completed(futures):
+                i, findings = future.result()
+                results[i] = findings
+                if findings_cache is not None:
+                    findings_cache.put(keys[i - 1], json.dumps(findings))
+                if progress:
+                    progress(len(results), total)
+
+    return [(i, results[i]) for i in sorted(results)]
+
+
+def analyze_sections(section_chain, document_content, data_path, max_concurrency=ANALYSIS_MAX_CONCURRENCY,
+                     progress=None, max_retries=5, area=None, findings_cache=None, stop=None):
+    """Map-reduce compliance analysis of a large document.
+
+    The document is split into sections, each is checked by
+    section_findings(), and the findings are merged into one report. With
+    a ``findings_cache``, a revised document only sends the sections that
+    changed and splices the stored findings of the rest into the new report.
+    """
+    findings = section_findings(section_chain, split_document(document_content), data_path, max_concurrency,
+                                progress, max_retries, area, findings_cache, stop)
+    return merge_findings(findings, get_act_index(data_path))
+
+
+def analyze_areas(section_chain, document_content, areas, max_concurrency=ANALYSIS_MAX_CONCURRENCY,
+                  progress=None, max_retries=5, findings_cache=None, stop=None):
+    """Sectioned analysis of one document against several policy areas at once.
+
+    The document is split once and the areas are analyzed concurrently, each
+    with up to ``max_concurrency`` calls of its own (the shared scheduler
+    still bounds the total). ``progress(done, total)`` counts sections over
+    all areas. Returns the combined report from merge_areas().
+    """
+    sections = split_document(document_content)
+    done = {area: 0 for area in areas}
+
+    def area_progress(area):
+        def update(finished, _):
+            done[area] = finished
+            if progress:
+                progress(sum(done.values()), len(sections) * len(areas))
+        return update
+
+    def run(area):
+        data_path = get_data_path(area)
+        findings = section_findings(section_chain, sections, data_path, max_concurrency, area_progress(area),
+                                    max_retries, area, findings_cache, stop)
+        return area, findings, get_act_index(data_path)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(areas))) as pool:
+        results = list(pool.map(lambda area: contextvars.copy_context().run(run, area), areas))
+    return merge_areas(results)
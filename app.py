@@ -1,9 +1,6 @@
 import streamlit as st
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
+import hashlib
 import os
 import time
 
@@ -11,40 +8,118 @@ import time
 load_dotenv()
 api_key = st.secrets["GOOGLE_API_KEY"]
 
-# Initialize the LLM
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-    api_key=api_key
-)
-
 from prompt import prompt, cp
+from chains import MODEL_NAME, TEMPERATURE, CHAT_SYSTEM_PROMPT
+from context_cache import get_context_cache
+from semantic_cache import SemanticChatCache
+from ingest import extract_pdf_pages
+from memory import ChatMemory
+from analysis import ANALYSIS_MAX_CONCURRENCY, changed_sections
+from corpus import POLICY_AREA_PATHS, get_data_path, get_master_document, load_master_data
+from report_cache import report_cache, report_key, section_cache
+from retrieval import retrieve_sections, format_sections, RETRIEVAL_TOP_K
+from service import FINISHED, LLMService
+from tokens import PROMPT_TOKEN_LIMIT, SYSTEM_PROMPTS, fits, prompt_tokens
+from tracing import span, tracer
 
-# Load master data
-def load_master_data(docx_path):
-    loader = Docx2txtLoader(docx_path)
-    data = loader.load()
-    return "\n".join([doc.page_content for doc in data])
-
-# Define analysis chain
-analysis_chain = ChatPromptTemplate.from_messages([
-    ("system", prompt),
-    ("human", "Company Policy: {company_policy}"),
-    ("human", "Document Content: {document_content}"),
-    ("human", "Provide a Professional Detailed Report.")
-]) | llm | StrOutputParser()
-
-# Define chat chain
-chat_chain = ChatPromptTemplate.from_messages([
-    ("system", "You are an expert assistant specialized in helping users understand company policies and compliance reports. The company policy content is: {company_policy}. If a report exists, its content is: {report_content}. Provide concise and accurate answers, referencing specific sections of the policy or report when relevant. If no report exists, assist based on the policy alone."),
-    ("human", "{user_question}")
-]) | llm | StrOutputParser()
-
-# Streamlit App Configuration
+# Streamlit App Configuration (must come before anything that renders, including
+# the spinner a cache_resource loader shows on its first call)
 st.set_page_config(page_title="Policy Analyzer", layout="wide")
+
+
+@st.cache_resource
+def load_service():
+    # One LLM client, job queue and rate budget shared by every session
+    return LLMService(api_key)
+
+
+service = load_service()
+
+
+@st.cache_resource
+def load_context_cache():
+    # Shared across sessions so every user reuses the same cached prefixes
+    return get_context_cache(api_key=api_key)
+
+
+context_cache = load_context_cache()
+
+
+@st.cache_resource
+def load_chat_cache():
+    # One answer cache for every session in this process
+    return SemanticChatCache()
+
+
+chat_cache = load_chat_cache()
+
+
+def cached_prefix(kind, master):
+    """Provider cache name for the system prompt + legislation prefix, if there is one."""
+    if context_cache is None:
+        return None
+    return context_cache.get(kind, prompt if kind == "analysis" else CHAT_SYSTEM_PROMPT, master).name
+
+
+def stream_into_state(chunks, key):
+    """Yield streamed text while keeping the partial result in session state."""
+    st.session_state[key] = ""
+    for chunk in chunks:
+        st.session_state[key] += chunk
+        yield chunk
+
+
+def stop_report_stream():
+    service.cancel(st.session_state.pop('report_job', None))
+    # Keep whatever was generated before the user pressed Stop
+    partial = st.session_state.pop('partial_report', "")
+    if partial:
+        st.session_state['report'] = partial + "\n\n_(Generation stopped early.)_"
+
+
+def stop_chat_stream():
+    service.cancel(st.session_state.pop('chat_job', None))
+    partial = st.session_state.pop('partial_reply', "")
+    if partial:
+        st.session_state['chat_memory'].add("assistant", partial + " _(stopped)_")
+
+
+GREETING = "Hello! You can ask me anything about the company policy, or upload a document to analyze it against the policy."
+REPORT_GREETING = "Hello! I've generated the compliance report. Feel free to ask me any questions about it or the company policy."
+
+
+def reset_chat(greeting):
+    service.cancel(st.session_state.pop('summary_job', (None, 0))[0])
+    st.session_state['chat_memory'] = ChatMemory(greeting)
+
+
+def collect_summary(memory):
+    """Apply the background summary of older turns once its job has finished."""
+    job_id, folded = st.session_state.get('summary_job', (None, 0))
+    if job_id is None:
+        return
+    try:
+        status = service.status(job_id)["status"]
+    except KeyError:
+        status = "failed"
+    if status not in FINISHED:
+        return
+    if status == "done":
+        memory.summarised(service.result(job_id), folded)
+    else:
+        # Without a model summary, keep a one-line abridgement of each turn
+        memory.fold()
+    service.forget(job_id)
+    del st.session_state['summary_job']
+
+
+def request_summary(memory, area):
+    """Fold turns that left the window into the summary, off the script thread."""
+    inputs = memory.summary_inputs()
+    if inputs is None or 'summary_job' in st.session_state:
+        return
+    st.session_state['summary_job'] = (service.submit("summary", inputs, area=area), len(memory.pending))
+
 st.markdown("""
     <style>
     .main {background: linear-gradient(to bottom, #1a1a1a, #2d2d2d); padding: 20px;}
@@ -117,37 +192,27 @@ with st.container():
         st.write("Subcategory selection unavailable until industry is fully implemented.")
 
 # Main content with equal columns
-AML_DATA_PATH = "./cleaned_document.docx"
-ARPA_DATA_PATH = "./ARPA1.docx"
-CREDIT_DATA_PATH = "./credit.docx"
-WORK_PLACE_HEALTH_SAFETY_PATH = "./wplhs.docx"
-TREASURY_LAW_DTA_PATH = "./tlcleaned.docx"
-PRIVACY_DATA_PATH = "./privacycleaned.docx"
+AML_DATA_PATH = POLICY_AREA_PATHS["AML"]
+
+
+@st.cache_resource
+def load_policy_indexes():
+    # Prebuilt hierarchical indexes (python rag.py build), loaded once per process on
+    # first use; rag pulls in FAISS and the embedding backend, so it is imported lazily
+    from rag import load_all_indexes
 
+    return load_all_indexes()
 
 if not os.path.exists(AML_DATA_PATH):
     st.error(f"Master data file not found at: {AML_DATA_PATH}")
 else:
-        # Set the data path based on the selected subcategory
-    if subcategory == "ARPA":
-        data_path = ARPA_DATA_PATH
-    # elif subcategory == "Credit":
-    #     data_path = CREDIT_DATA_PATH
-    elif subcategory == "AML":
-        data_path = AML_DATA_PATH
-    elif subcategory == "Work place health and safety":
-        data_path = WORK_PLACE_HEALTH_SAFETY_PATH
-    elif subcategory == "Treasury Law":
-        data_path = TREASURY_LAW_DTA_PATH
-    elif subcategory == "Privacy":
-        data_path = PRIVACY_DATA_PATH
-    else :
-         data_path = AML_DATA_PATH
+    # Set the data path based on the selected subcategory
+    data_path = get_data_path(subcategory)
     print(data_path)
     company_policy = load_master_data(data_path)
     
-    if 'chat_history' not in st.session_state:
-        st.session_state['chat_history'] = [{"role": "assistant", "content": "Hello! You can ask me anything about the company policy, or upload a document to analyze it against the policy."}]
+    if 'chat_memory' not in st.session_state:
+        reset_chat(GREETING)
     
     # Equal column layout
     col1, col2 = st.columns(2, gap="medium")
@@ -165,36 +230,128 @@ else:
         )
         
         if uploaded_file is not None:
-            with open("temp.pdf", "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            upload_bytes = uploaded_file.getvalue()
+            upload_hash = hashlib.sha256(upload_bytes).hexdigest()
+            # Extract once per upload; chat and widget reruns reuse the pages
+            if st.session_state.get('upload_hash') != upload_hash:
+                progress = st.progress(0, text="Reading PDF...")
+                pages = extract_pdf_pages(
+                    upload_bytes, source=uploaded_file.name,
+                    progress=lambda done, total: progress.progress(done / total, text=f"Read page {done} of {total}")
+                )
+                progress.empty()
+                st.session_state['upload_pages'] = pages
+                st.session_state['upload_content'] = "\n".join(page.page_content for page in pages)
+                st.session_state['upload_hash'] = upload_hash
+            pages = st.session_state['upload_pages']
+            document_content = st.session_state['upload_content']
             
-            progress = st.progress(0)
-            loader = PyPDFLoader("temp.pdf")
-            pages = loader.load_and_split()
-            for i in range(100):
-                time.sleep(0.01)
-                progress.progress(i + 1)
-            document_content = "\n".join(page.page_content for page in pages)
-            
-            if st.button("Analyze Document 📊", key="analyze"):
-                with st.spinner("Analyzing document..."):
-                    try:
-                        report = analysis_chain.invoke({
-                            "company_policy": company_policy,
-                            "document_content": document_content
-                        })
+            analysis_mode = st.radio(
+                "Analysis mode",
+                ["Full document", "Sectioned (parallel)", "Multiple policy areas"],
+                horizontal=True,
+                help="'Sectioned' checks each part of a long document against the most relevant legislation concurrently. "
+                     "'Multiple policy areas' does this for several areas at once and combines the results."
+            )
+            if analysis_mode == "Multiple policy areas":
+                selected_areas = st.multiselect(
+                    "Policy areas to check", list(POLICY_AREA_PATHS),
+                    default=[subcategory] if subcategory in POLICY_AREA_PATHS else [],
+                    help="The document is split once and checked against every selected area concurrently."
+                )
+                mode = "multi"
+                master_version = "|".join(f"{area}={get_master_document(get_data_path(area)).version}"
+                                          for area in selected_areas)
+            else:
+                full_inputs = {"company_policy": company_policy, "document_content": document_content}
+                # Pre-flight: a full-document prompt over the limit would only fail after the round trip
+                mode = "sectioned" if analysis_mode == "Sectioned (parallel)" or not fits("analysis", full_inputs) else "full"
+                if analysis_mode == "Full document" and mode == "sectioned":
+                    st.info(f"This document plus the legislation is ~{prompt_tokens('analysis', full_inputs):,} tokens "
+                            f"(limit {PROMPT_TOKEN_LIMIT:,}), so it will be analyzed in sections.")
+                # A revision of a document analyzed before only needs its changed sections re-checked; full
+                # document mode stays an explicit choice and always sends the whole text
+                changed, total_sections = changed_sections(document_content, data_path, section_cache)
+                if changed < total_sections and mode == "sectioned":
+                    st.info(f"{total_sections - changed} of {total_sections} sections are unchanged since an earlier analysis; "
+                            f"only the {changed} changed section(s) will be sent to the model.")
+                elif changed < total_sections:
+                    st.caption(f"{total_sections - changed} of {total_sections} sections were analyzed before. Choose "
+                               f"'Sectioned (parallel)' to re-check only the {changed} changed section(s).")
+                master_version = get_master_document(data_path).version
+            # Sectioned and multi-area reports come from the section prompt, so that is what keys them
+            cache_key = report_key(upload_hash, master_version, prompt if mode == "full" else SYSTEM_PROMPTS["section"],
+                                   MODEL_NAME, TEMPERATURE, mode=mode)
+            if st.button("Analyze Document 📊", key="analyze", disabled=mode == "multi" and not selected_areas):
+                try:
+                    with span("request.analysis", area=subcategory, mode=mode) as request_span:
+                        st.session_state['last_trace'] = request_span.trace_id
+                        cached_report = report_cache.get(cache_key)
+                        if cached_report is not None:
+                            report = cached_report
+                        elif mode in ("sectioned", "multi"):
+                            if mode == "multi":
+                                job_id = service.submit(
+                                    "multi", {"document_content": document_content, "areas": selected_areas},
+                                    max_concurrency=ANALYSIS_MAX_CONCURRENCY, findings_cache=section_cache
+                                )
+                            else:
+                                job_id = service.submit(
+                                    "sectioned", {"document_content": document_content, "data_path": data_path},
+                                    max_concurrency=ANALYSIS_MAX_CONCURRENCY, area=subcategory, findings_cache=section_cache
+                                )
+                            st.session_state['report_job'] = job_id
+                            stop_placeholder = st.empty()
+                            stop_placeholder.button("Stop ⏹️", key="stop_analysis", on_click=stop_report_stream)
+                            try:
+                                with st.spinner("Analyzing document..."):
+                                    section_progress = st.progress(0, text="Waiting for a free slot...")
+                                    # Poll the service; the analysis itself runs off the script thread
+                                    status = service.status(job_id)
+                                    while status["status"] not in FINISHED:
+                                        done, total = status["progress"]
+                                        # Updated on every poll, which is also where a rerun can end the loop
+                                        section_progress.progress(done / total if total else 0.0,
+                                                                  text=f"Analyzed {done} of {total} sections" if total
+                                                                  else "Waiting for a free slot...")
+                                        time.sleep(0.25)
+                                        status = service.status(job_id)
+                                    report = service.result(job_id)
+                            finally:
+                                # A rerun (Stop, or any other widget) ends the poll; the job is cancelled
+                                # rather than left running for a result nobody will read
+                                service.cancel(st.session_state.pop('report_job', None))
+                            stop_placeholder.empty()
+                        else:
+                            stop_placeholder = st.empty()
+                            stop_placeholder.button("Stop ⏹️", key="stop_analysis", on_click=stop_report_stream)
+                            job_id = service.submit("analysis", full_inputs, area=subcategory,
+                                                    cached_content=cached_prefix("analysis", get_master_document(data_path)))
+                            st.session_state['report_job'] = job_id
+                            report = st.write_stream(stream_into_state(service.stream(job_id), 'partial_report'))
+                            stop_placeholder.empty()
+                            st.session_state.pop('partial_report', None)
+                            st.session_state.pop('report_job', None)
+                            service.forget(job_id)
+                        if cached_report is None:
+                            report_cache.put(cache_key, report)
                         st.session_state['report'] = report
-                        st.session_state['chat_history'] = [{"role": "assistant", "content": "Hello! I've generated the compliance report. Feel free to ask me any questions about it or the company policy."}]
-                        st.toast("Analysis complete!", icon="✅")
-                    except Exception as e:
-                        st.toast(f"Error: {e}", icon="❌")
-                os.remove("temp.pdf")
+                        reset_chat(REPORT_GREETING)
+                        st.toast("Loaded cached report!" if cached_report is not None else "Analysis complete!", icon="✅")
+                except Exception as e:
+                    st.toast(f"Error: {e}", icon="❌")
         
         if 'report' in st.session_state:
             st.markdown("#### Analysis Report")
             st.markdown(f"{st.session_state['report'][:200]}... [Expand]", unsafe_allow_html=True)
             with st.expander("View Full Report"):
                 st.markdown(st.session_state['report'])
+            cache_stats = report_cache.stats()
+            st.caption(f"Report cache: {cache_stats.get('hits', 0)} hits / {cache_stats.get('misses', 0)} misses")
+            if context_cache is not None:
+                prefix_stats = context_cache.stats()
+                st.caption(f"Prompt prefix cache ({prefix_stats['backend']}): {prefix_stats['hits']} hits, "
+                           f"~{prefix_stats['cached_tokens']} tokens reused")
             st.download_button(
                 label="Download Report 📤",
                 data=st.session_state['report'],
@@ -207,12 +364,24 @@ else:
     with col2:
         st.markdown('<div class="section-container">', unsafe_allow_html=True)
         st.subheader("Chat with Policy & Report")
+        chat_mode = st.radio(
+            "Legislation context",
+            ["Full legislation", "Relevant sections only"],
+            horizontal=True,
+            help="'Relevant sections only' sends the top matching sections of the act instead of the whole text."
+        )
         
-        chat_html = ""
-        for msg in st.session_state['chat_history']:
-            timestamp = time.strftime("%I:%M %p")
-            chat_html += f'<div style="display: flex; justify-content: {"flex-end" if msg["role"] == "user" else "flex-start"};"><div class="chat-message {msg["role"]}-message" role="log" aria-label="{msg["role"]} message">{msg["content"]} <span style="font-size: 12px; color: #888;">{timestamp}</span></div></div>'
-        st.markdown(f'<div class="chat-container">{chat_html}</div>', unsafe_allow_html=True)
+        memory = st.session_state['chat_memory']
+        collect_summary(memory)
+        # Each message's HTML is built once, when it is added; only the last CHAT_DISPLAY_MESSAGES are kept
+        st.markdown(f'<div class="chat-container">{"".join(memory.display)}</div>', unsafe_allow_html=True)
+        if memory.summary:
+            with st.expander("Earlier conversation (summarised)"):
+                st.markdown(memory.summary)
+        answer_stats = chat_cache.stats()
+        st.caption(f"Answer cache: {answer_stats['hits']} hits / {answer_stats['misses']} misses "
+                   f"({answer_stats['hit_rate']:.0%} hit rate)")
+        live_reply = st.empty()
         
         # Chat input section
         with st.container():
@@ -225,23 +394,74 @@ else:
             with col_send:
                 if st.button("Send 📩", key="send_chat", disabled=not user_input):
                     if user_input:
-                        st.session_state['chat_history'].append({"role": "user", "content": user_input})
-                        with st.spinner("Thinking..."):
+                        with span("request.chat", area=subcategory, mode=chat_mode) as request_span:
+                            st.session_state['last_trace'] = request_span.trace_id
+                            chat_history = memory.context()
+                            # Answers to follow-ups depend on the conversation, so only opening questions use the cache
+                            standalone = memory.count == 0
+                            memory.add("user", user_input)
                             report_content = st.session_state.get('report', "No report generated yet.")
-                            response = chat_chain.invoke({
-                                "company_policy": company_policy,
-                                "report_content": report_content,
-                                "user_question": user_input
-                            })
-                            st.session_state['chat_history'].append({"role": "assistant", "content": response})
-                        st.toast("Message sent!", icon="✉️")
+                            chat_scope = chat_cache.scope(
+                                subcategory, get_master_document(data_path).version,
+                                hashlib.sha256(report_content.encode("utf-8")).hexdigest(), chat_mode
+                            )
+                            cached_answer = chat_cache.get(chat_scope, user_input) if standalone else None
+                            if cached_answer is not None:
+                                response = cached_answer[0]
+                            else:
+                                full_context = chat_mode == "Full legislation" and fits("chat", {
+                                    "company_policy": company_policy, "report_content": report_content,
+                                    "chat_history": chat_history, "user_question": user_input})
+                                if chat_mode == "Full legislation" and not full_context:
+                                    st.toast("The legislation and report are too large to send whole; using relevant sections.")
+                                if full_context:
+                                    policy_context = company_policy
+                                elif subcategory in load_policy_indexes():
+                                    chunks = load_policy_indexes()[subcategory].retrieve(user_input)
+                                    policy_context = format_sections([chunk.page_content for chunk in chunks])
+                                else:
+                                    policy_context = format_sections(retrieve_sections(data_path, user_input, k=RETRIEVAL_TOP_K))
+                                prefix_name = cached_prefix("chat", get_master_document(data_path)) if full_context else None
+                                stop_placeholder = st.empty()
+                                stop_placeholder.button("Stop ⏹️", key="stop_chat", on_click=stop_chat_stream)
+                                job_id = service.submit("chat", {
+                                    "company_policy": policy_context,
+                                    "report_content": report_content,
+                                    "chat_history": chat_history,
+                                    "user_question": user_input
+                                }, cached_content=prefix_name, area=subcategory)
+                                st.session_state['chat_job'] = job_id
+                                with live_reply.container():
+                                    response = st.write_stream(stream_into_state(service.stream(job_id), 'partial_reply'))
+                                st.session_state.pop('partial_reply', None)
+                                st.session_state.pop('chat_job', None)
+                                service.forget(job_id)
+                                if standalone:
+                                    chat_cache.put(chat_scope, user_input, response)
+                            memory.add("assistant", response)
+                            request_summary(memory, subcategory)
+                            st.toast("Answered from cache!" if cached_answer is not None else "Message sent!", icon="✉️")
                         st.rerun()
             with col_clear:
                 if st.button("Clear 🗑️", key="clear_chat"):
-                    st.session_state['chat_history'] = [{"role": "assistant", "content": "Hello! You can ask me anything about the company policy, or upload a document to analyze it against the policy."}]
+                    reset_chat(GREETING)
                     st.toast("Chat cleared!", icon="🧹")
                     st.rerun()
         st.markdown('</div>', unsafe_allow_html=True)
 
+# Debug panel: where the time went in this session's last request
+if st.sidebar.checkbox("Show timing breakdown", help="Per-stage timings of the last request, and p50/p95 per stage."):
+    last_spans = tracer.trace(st.session_state.get('last_trace'))
+    if last_spans:
+        origin = last_spans[0].start_ns
+        st.sidebar.markdown("**Last request**")
+        st.sidebar.table([
+            {"stage": s.name, "start (ms)": round((s.start_ns - origin) / 1e6, 1), "duration (ms)": round(s.duration_ms, 1),
+             "status": s.status}
+            for s in last_spans
+        ])
+    st.sidebar.markdown("**All requests (this process)**")
+    st.sidebar.table([{"stage": name, **values} for name, values in tracer.stats().items()])
+
 # Footer
 st.markdown('<div class="footer">Powered by SSR | © 2025</div>', unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts"))
+ARTIFACT_FORMAT_VERSION = 2
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+def artifact_dir(source_path):
+    """Artifacts are stored per master document, named after its file stem."""
+    return os.path.join(ARTIFACT_DIR, os.path.splitext(os.path.basename(source_path))[0])
+
+
+class LegislationArtifact:
+    """A compiled master document: normalised text, section table, section tree and optional embeddings.
+
+    Loading reads the manifest; text.txt is read on first use and
+    embeddings.npy is memory-mapped, so no docx is decompressed or parsed.
+    """
+
+    def __init__(self, directory, manifest, stale=False):
+        self.directory = directory
+        self.manifest = manifest
+        self.version = manifest["source_version"]
+        self.stale = stale
+        self._text = None
+        self._sections = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            with open(os.path.join(self.directory, "text.txt"), encoding="utf-8", newline="") as f:
+                self._text = f.read()
+        return self._text
+
+    @property
+    def sections(self):
+        """[{"start", "end", "tokens", ...}] with character offsets into text."""
+        if self._sections is None:
+            with open(os.path.join(self.directory, "sections.json"), encoding="utf-8") as f:
+                self._sections = json.load(f)
+        return self._sections
+
+    def section_texts(self):
+        text = self.text
+        return [text[s["start"]:s["end"]] for s in self.sections]
+
+    def structure(self):
+        """The act's section tree (structure.ActIndex) as parsed at build time."""
+        from structure import ActIndex
+
+        with open(os.path.join(self.directory, "structure.json"), encoding="utf-8") as f:
+            return ActIndex.from_list(json.load(f))
+
+    def embeddings(self):
+        """Section embedding matrix (memory-mapped), or None if it was not built."""
+        path = os.path.join(self.directory, "embeddings.npy")
+        return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+
+def load_artifact(source_path, stat=None):
+    """Load the artifact for a master document if it is still fresh.
+
+    Freshness is checked against the source's size/mtime recorded at build
+    time; callers that have already hashed the source can compare
+    ``artifact.version`` instead.
+    """
+    directory = artifact_dir(source_path)
+    try:
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get("format") != ARTIFACT_FORMAT_VERSION:
+        return None
+    stale = stat is not None and (manifest["source_size"], manifest["source_mtime_ns"]) != (stat.st_size, stat.st_mtime_ns)
+    return LegislationArtifact(directory, manifest, stale)
+
+
+def build_artifact(source_path, with_embeddings=False, embedding_backend=None):
+    """Compile one master document into its artifact directory."""
+    from corpus import file_digest, parse_master_document
+    from retrieval import section_spans
+    from structure import parse_act
+
+    started = time.perf_counter()
+    stat = os.stat(source_path)
+    text = parse_master_document(source_path)
+    spans = section_spans(text)
+    encoded = text.encode("utf-8")
+    act_index = parse_act(text, title=os.path.splitext(os.path.basename(source_path))[0])
+    sections = [{"start": start, "end": end, "tokens": estimate_tokens(text[start:end]),
+                 "citation": act_index.citation_at(start).id} for start, end in spans]
+
+    directory = artifact_dir(source_path)
+    manifest_path = os.path.join(directory, "manifest.json")
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    with open(os.path.join(directory, "text.txt"), "wb") as f:
+        f.write(encoded)
+    with open(os.path.join(directory, "sections.json"), "w", encoding="utf-8") as f:
+        json.dump(sections, f)
+    with open(os.path.join(directory, "structure.json"), "w", encoding="utf-8") as f:
+        json.dump(act_index.to_list(), f)
+
+    manifest = {
+        "format": ARTIFACT_FORMAT_VERSION,
+        "source": os.path.basename(source_path),
+        "source_version": file_digest(source_path),
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "chars": len(text),
+        "bytes": len(encoded),
+        "tokens": estimate_tokens(text),
+        "sections": len(sections),
+        "structure_nodes": len(act_index.nodes),
+        "embeddings": None,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    embeddings_path = os.path.join(directory, "embeddings.npy")
+    if with_embeddings:
+        from embeddings import backend_fingerprint, get_embeddings
+
+        embeddings = get_embeddings(embedding_backend)
+        matrix = np.asarray(embeddings.embed_documents([text[s:e] for s, e in spans]), dtype=np.float32)
+        np.save(embeddings_path, matrix)
+        manifest["embeddings"] = backend_fingerprint(embeddings)
+    elif os.path.exists(embeddings_path):
+        os.remove(embeddings_path)
+
+    # The manifest is written last so a half-built artifact is never loaded
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    manifest["build_seconds"] = round(time.perf_counter() - started, 3)
+    return manifest
+
+
+def parse_args():
+    from corpus import POLICY_AREA_PATHS
+
+    parser = argparse.ArgumentParser(description="Compile master legislation into fast-loading artifacts.")
+    parser.add_argument("--areas", nargs="+", default=list(POLICY_AREA_PATHS), choices=list(POLICY_AREA_PATHS),
+                        help="Policy areas to compile (default: all).")
+    parser.add_argument("--files", nargs="+", default=[], help="Extra master documents to compile.")
+    parser.add_argument("--embeddings", action="store_true", help="Also store a section embedding matrix.")
+    parser.add_argument("--embedding-backend", default=None, help="Embedding backend (default: $EMBEDDING_BACKEND).")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from corpus import POLICY_AREA_PATHS
+
+    args = parse_args()
+    for path in [POLICY_AREA_PATHS[area] for area in args.areas] + args.files:
+        manifest = build_artifact(path, args.embeddings, args.embedding_backend)
+        print(f"{manifest['source']}: {manifest['sections']} sections, ~{manifest['tokens']} tokens "
+              f"in {manifest['build_seconds']}s -> {artifact_dir(path)}")
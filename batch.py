@@ -0,0 +1,200 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from analysis import analyze_sections
+from artifacts import estimate_tokens
+from chains import MODEL_NAME, TEMPERATURE, build_analysis_chain, build_section_chain, get_llm
+from context_cache import get_context_cache
+from corpus import POLICY_AREA_PATHS, area_slug, get_data_path, get_master_document, parse_master_document
+from ingest import extract_pdf_pages
+from prompt import prompt
+from report_cache import report_cache, report_key, section_cache
+from scheduler import llm_scheduler
+from tokens import SYSTEM_PROMPTS, fits, usage_config
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+
+
+def file_hash(path):
+    """sha256 of a file's bytes, without extracting its text."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_document(path):
+    """Return (sha256 of the file bytes, extracted text) for a PDF or docx."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.lower().endswith(".pdf"):
+        text = "\n".join(page.page_content for page in extract_pdf_pages(data, source=path))
+    else:
+        text = parse_master_document(path)
+    return hashlib.sha256(data).hexdigest(), text
+
+
+class BatchIndex:
+    """Resumable progress record for a batch run, saved as index.json."""
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, "index.json")
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)["entries"]
+        else:
+            self.entries = {}
+
+    @staticmethod
+    def key(document, area):
+        return f"{document}::{area}"
+
+    def is_done(self, document, area, document_hash):
+        entry = self.entries.get(self.key(document, area))
+        return (entry is not None and entry["status"] == "done" and entry["document_hash"] == document_hash
+                and os.path.exists(os.path.join(os.path.dirname(self.path), entry["report"])))
+
+    def record(self, document, area, **fields):
+        with self._lock:
+            self.entries[self.key(document, area)] = {"document": document, "area": area, **fields}
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"model": MODEL_NAME, "entries": self.entries}, f, indent=2)
+            os.replace(tmp, self.path)
+
+    def write_summary(self):
+        lines = ["# Batch compliance audit", "", "| Document | Policy area | Status | Report |", "|---|---|---|---|"]
+        for entry in sorted(self.entries.values(), key=lambda e: (e["document"], e["area"])):
+            report = f"[{entry['report']}]({entry['report']})" if entry["status"] == "done" else entry.get("error", "")
+            lines.append(f"| {entry['document']} | {entry['area']} | {entry['status']} | {report} |")
+        with open(os.path.join(os.path.dirname(self.path), "index.md"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def run_batch(input_dir, areas, output_dir, concurrency=4, max_retries=5, mode="full"):
+    """Analyze every PDF/docx in input_dir against each policy area."""
+    os.makedirs(output_dir, exist_ok=True)
+    index = BatchIndex(output_dir)
+    llm = get_llm(os.getenv("GOOGLE_API_KEY"))
+    analysis_chain = build_analysis_chain(llm)
+    section_chain = build_section_chain(llm)
+    context_cache = get_context_cache()
+
+    documents = sorted(
+        name for name in os.listdir(input_dir)
+        if name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith("~$")
+    )
+
+    texts = {}
+    text_locks = {name: threading.Lock() for name in documents}
+
+    def document_text(name):
+        # Extracted once per document (in a worker) and shared by its areas; failures are remembered too
+        with text_locks[name]:
+            if name not in texts:
+                try:
+                    texts[name] = read_document(os.path.join(input_dir, name))[1]
+                except Exception as e:
+                    texts[name] = e
+            if isinstance(texts[name], Exception):
+                raise texts[name]
+            return texts[name]
+
+    def analyze(name, document_hash, area):
+        started = time.perf_counter()
+        text = document_text(name)
+        data_path = get_data_path(area)
+        legislation = get_master_document(data_path)
+        # The file name keeps its extension so policy.pdf and policy.docx get separate directories
+        report_path = os.path.join(name, f"{area_slug(area)}.md")
+        inputs = {"company_policy": legislation.text, "document_content": text}
+        # Key on the mode that actually runs, as the app does
+        effective_mode = "sectioned" if mode == "sectioned" or not fits("analysis", inputs) else "full"
+        system_prompt = SYSTEM_PROMPTS["section"] if effective_mode == "sectioned" else prompt
+        cache_key = report_key(document_hash, legislation.version, system_prompt, MODEL_NAME, TEMPERATURE,
+                               mode=effective_mode)
+        report = report_cache.get(cache_key)
+        if report is None:
+            if effective_mode == "sectioned":
+                # Each map call is scheduled (and retried) on its own
+                report = analyze_sections(section_chain, text, data_path, max_retries=max_retries, area=area,
+                                          findings_cache=section_cache)
+            else:
+                # Every document checked against this area shares the prompt + act prefix
+                context = context_cache.get("analysis", prompt, legislation) if context_cache else None
+                chain = build_analysis_chain(llm, context.name) if context and context.name else analysis_chain
+                report = llm_scheduler.call(lambda: chain.invoke(inputs, config=usage_config(area, "analysis")),
+                                            tokens=estimate_tokens(prompt + legislation.text + text),
+                                            max_retries=max_retries)
+            report_cache.put(cache_key, report)
+        os.makedirs(os.path.join(output_dir, os.path.dirname(report_path)), exist_ok=True)
+        with open(os.path.join(output_dir, report_path), "w", encoding="utf-8") as f:
+            f.write(report)
+        return report_path, time.perf_counter() - started
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {}
+        for name in documents:
+            # Only the bytes are hashed here; extraction happens in the workers, so one unreadable
+            # file fails its own entries instead of the run
+            try:
+                document_hash = file_hash(os.path.join(input_dir, name))
+            except OSError as e:
+                failures += 1
+                for area in areas:
+                    index.record(name, area, status="failed", document_hash=None, error=str(e)[:500])
+                print(f"FAIL  {name}: {e}", file=sys.stderr)
+                continue
+            for area in areas:
+                if index.is_done(name, area, document_hash):
+                    print(f"skip  {name} [{area}] (already done)")
+                    continue
+                future = pool.submit(analyze, name, document_hash, area)
+                futures[future] = (name, area, document_hash)
+
+        for future in as_completed(futures):
+            name, area, document_hash = futures[future]
+            try:
+                report_path, seconds = future.result()
+            except Exception as e:
+                failures += 1
+                index.record(name, area, status="failed", document_hash=document_hash, error=str(e)[:500])
+                print(f"FAIL  {name} [{area}]: {e}", file=sys.stderr)
+            else:
+                index.record(name, area, status="done", document_hash=document_hash, report=report_path,
+                             seconds=round(seconds, 2))
+                print(f"done  {name} [{area}] -> {report_path} ({seconds:.1f}s)")
+
+    index.write_summary()
+    return failures
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Audit a directory of policy documents against policy areas.")
+    parser.add_argument("input_dir", help="Directory containing .pdf/.docx policy documents.")
+    parser.add_argument("--areas", nargs="+", default=list(POLICY_AREA_PATHS), choices=list(POLICY_AREA_PATHS),
+                        help="Policy areas to check each document against (default: all).")
+    parser.add_argument("--output-dir", default="reports", help="Where reports and index.json/index.md are written.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum concurrent analyses.")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries per analysis on rate-limit errors.")
+    parser.add_argument("--mode", choices=["full", "sectioned"], default="full",
+                        help="'full' sends the whole act per call; 'sectioned' uses map-reduce analysis.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    args = parse_args()
+    failed = run_batch(args.input_dir, args.areas, args.output_dir, args.concurrency, args.max_retries, args.mode)
+    sys.exit(1 if failed else 0)
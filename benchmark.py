@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from analysis import analyze_sections
+from batch import read_document
+from chains import build_analysis_chain, build_chat_chain, build_section_chain
+from corpus import BASE_DIR, POLICY_AREA_PATHS, get_data_path, get_master_document
+from fake_llm import FakeChatModel
+from memory import ChatMemory
+from retrieval import RETRIEVAL_TOP_K, format_sections, retrieve_sections
+from scheduler import llm_scheduler
+from tokens import fits, prompt_tokens, usage_config, usage_log
+from tracing import span, tracer
+
+# The bundled acts, used here as stand-in "uploaded" policy documents
+BENCHMARK_DOCUMENTS = ["ARPA1.docx", "ASIC1.docx", "ASIC2.docx", "privacy1.docx", "tl.docx", "wpl.docx"]
+CHAT_QUESTIONS = [
+    "What are the customer identification requirements?",
+    "Which records must be kept and for how long?",
+    "What must be reported to the regulator?",
+]
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_benchmark(documents, area, modes, latency, tokens_per_second, chat_questions):
+    """Run ingestion -> prompt -> chain -> report for each document with the fake LLM."""
+    llm = FakeChatModel(latency=latency, tokens_per_second=tokens_per_second)
+    analysis_chain = build_analysis_chain(llm)
+    section_chain = build_section_chain(llm)
+    chat_chain = build_chat_chain(llm)
+    data_path = get_data_path(area)
+    legislation = get_master_document(data_path).text
+
+    results = []
+    started = time.perf_counter()
+    for path in documents:
+        name = os.path.basename(path)
+        result = {"document": name}
+        with span("bench.document", document=name):
+            t = time.perf_counter()
+            with span("bench.ingest"):
+                _, text = read_document(path)
+            result["ingest_seconds"] = round(time.perf_counter() - t, 4)
+            result["chars"] = len(text)
+
+            inputs = {"company_policy": legislation, "document_content": text}
+            result["full_prompt_tokens"] = prompt_tokens("analysis", inputs)
+            for mode in modes:
+                t = time.perf_counter()
+                with span(f"bench.{mode}"):
+                    if mode == "full" and fits("analysis", inputs):
+                        report = analysis_chain.invoke(inputs, config=usage_config(area, "analysis"))
+                    else:
+                        report = analyze_sections(section_chain, text, data_path, area=area)
+                result[f"{mode}_seconds"] = round(time.perf_counter() - t, 4)
+                result[f"{mode}_report_chars"] = len(report)
+
+            t = time.perf_counter()
+            with span("bench.chat"):
+                memory = ChatMemory()
+                for question in chat_questions:
+                    context = format_sections(retrieve_sections(data_path, question, k=RETRIEVAL_TOP_K))
+                    answer = chat_chain.invoke({"company_policy": context, "report_content": report,
+                                                "chat_history": memory.context(), "user_question": question},
+                                               config=usage_config(area, "chat"))
+                    memory.add("user", question)
+                    memory.add("assistant", answer)
+            result["chat_seconds"] = round(time.perf_counter() - t, 4)
+        results.append(result)
+        print(f"{name}: {result}", file=sys.stderr)
+    return results, time.perf_counter() - started
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the analysis and chat pipelines (fake LLM).")
+    parser.add_argument("--documents", nargs="+", default=[os.path.join(BASE_DIR, d) for d in BENCHMARK_DOCUMENTS],
+                        help="Documents to analyze (default: the bundled docx corpus).")
+    parser.add_argument("--area", default="AML", choices=list(POLICY_AREA_PATHS), help="Policy area to check against.")
+    parser.add_argument("--modes", nargs="+", default=["full", "sectioned"], choices=["full", "sectioned"])
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM time to first token (s).")
+    parser.add_argument("--tokens-per-second", type=float, default=2000, help="Fake LLM output rate.")
+    parser.add_argument("--chat-questions", type=int, default=len(CHAT_QUESTIONS), help="Chat turns per document.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where the JSON results are written.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Keep benchmark spans and token counts out of the app's logs
+    tracer.path = ""
+    usage_log.path = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "usage.jsonl")
+    # The fake LLM has no provider quota to respect
+    llm_scheduler.rpm = llm_scheduler.tpm = float("inf")
+
+    documents = [path for path in args.documents if os.path.exists(path)]
+    results, wall = run_benchmark(documents, args.area, args.modes, args.latency, args.tokens_per_second,
+                                  CHAT_QUESTIONS[:args.chat_questions])
+    usage = usage_log.summary()
+    output = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"area": args.area, "modes": args.modes, "latency": args.latency,
+                   "tokens_per_second": args.tokens_per_second, "chat_questions": args.chat_questions},
+        "totals": {
+            "documents": len(results),
+            "wall_seconds": round(wall, 3),
+            "docs_per_second": round(len(results) / wall, 4) if wall else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "llm_calls": sum(total["calls"] for total in usage.values()),
+            "prompt_tokens": sum(total["prompt_tokens"] for total in usage.values()),
+            "completion_tokens": sum(total["completion_tokens"] for total in usage.values()),
+        },
+        "stages": tracer.stats(),
+        "documents": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+    print(json.dumps(output["totals"], indent=2))
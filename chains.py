@@ -0,0 +1,104 @@
+import functools
+import os
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from prompt import prompt
+from tracing import traced
+
+MODEL_NAME = "gemini-2.0-flash"
+TEMPERATURE = 0
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+
+CHAT_SYSTEM_PROMPT = "You are an expert assistant specialized in helping users understand company policies and compliance reports. The company policy content and, if one exists, the compliance report are given below. Provide concise and accurate answers, referencing specific sections of the policy or report when relevant. If no report exists, assist based on the policy alone. Use the conversation so far to resolve follow-up questions."
+
+SUMMARY_SYSTEM_PROMPT = "You maintain the running summary of a conversation about company policies and a compliance report. Merge the new messages into the existing summary. Keep the user's questions, the answers' key facts, cited sections and any decisions or open points; drop pleasantries. Reply with the updated summary only, in at most {max_words} words."
+
+SECTION_INSTRUCTIONS = """Analyze ONLY this section of the uploaded document against the legislation excerpts above.
+Report your findings using exactly these four markdown headings, in this order:
+### Aligned Provisions
+### Gaps/Discrepancies
+### Compliance Risks
+### Recommendations
+Use one bullet point per finding, cite the regulatory clause where possible using the section IDs shown in the excerpt labels (e.g. s28 or s28(1)),
+and give each compliance risk a severity (Low, Medium or High).
+Write "None identified." under a heading that has no findings. Do not add an introduction or conclusion."""
+
+
+# Initialize the LLM ("fake" runs offline, for tests and benchmarks)
+@traced("build_llm")
+def build_llm(api_key=None, backend=None):
+    if (backend or LLM_BACKEND) == "fake":
+        from fake_llm import FakeChatModel
+
+        return FakeChatModel()
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=MODEL_NAME,
+        temperature=TEMPERATURE,
+        max_tokens=None,
+        timeout=None,
+        max_retries=2,
+        api_key=api_key
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_llm(api_key=None, backend=None):
+    """The process's LLM client for these settings, built on first use and then reused."""
+    return build_llm(api_key, backend)
+
+
+# Prompts start with a stable prefix (system prompt, then the legislation) so it
+# can be cached provider-side; only the messages after it change per call.
+ANALYSIS_PREFIX = [("system", prompt), ("human", "Company Policy: {company_policy}")]
+CHAT_PREFIX = [("system", CHAT_SYSTEM_PROMPT), ("human", "Company Policy: {company_policy}")]
+
+
+def with_prefix(prefix, messages, llm, cached_content=None):
+    if cached_content:
+        # The provider already holds the prefix under this name
+        return ChatPromptTemplate.from_messages(messages) | llm.bind(cached_content=cached_content) | StrOutputParser()
+    return ChatPromptTemplate.from_messages(prefix + messages) | llm | StrOutputParser()
+
+
+# Define analysis chain
+@traced("build_chain.analysis")
+def build_analysis_chain(llm, cached_content=None):
+    return with_prefix(ANALYSIS_PREFIX, [
+        ("human", "Document Content: {document_content}"),
+        ("human", "Provide a Professional Detailed Report.")
+    ], llm, cached_content)
+
+
+# Define per-section (map step) analysis chain
+@traced("build_chain.section")
+def build_section_chain(llm):
+    return ChatPromptTemplate.from_messages([
+        ("system", prompt),
+        ("human", "Legislation excerpts: {company_policy}"),
+        ("human", "Document Section {section_label}: {document_content}"),
+        ("human", SECTION_INSTRUCTIONS)
+    ]) | llm | StrOutputParser()
+
+
+# Define chat chain
+@traced("build_chain.chat")
+def build_chat_chain(llm, cached_content=None):
+    return with_prefix(CHAT_PREFIX, [
+        ("human", "Compliance Report: {report_content}"),
+        ("human", "Conversation so far: {chat_history}"),
+        ("human", "{user_question}")
+    ], llm, cached_content)
+
+
+# Define chat summary chain (folds older turns into the running summary)
+@traced("build_chain.summary")
+def build_summary_chain(llm):
+    return ChatPromptTemplate.from_messages([
+        ("system", SUMMARY_SYSTEM_PROMPT),
+        ("human", "Summary so far: {summary}"),
+        ("human", "New messages:\n{messages}")
+    ]) | llm | StrOutputParser()
@@ -1,24 +1,109 @@
+import argparse
+import fnmatch
+import json
+import os
 import re
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 from docx import Document
 from docx.shared import Pt
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 
-def is_pure_artifact(paragraph_text):
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cleaner_rules")
+DEFAULT_RULE_SET = "aml"
+# Rough token estimate used when reporting how much prompt text a rule removes
+CHARS_PER_TOKEN = 4
+WHITESPACE_PATTERN = re.compile(r'[ \t]+')
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_P, W_T, W_TAB, W_BR, W_CR, W_BODY = (W_NS + tag for tag in ("p", "t", "tab", "br", "cr", "body"))
+
+class ArtifactRules:
+    """A per-act artifact rule set compiled into one named-group alternation.
+
+    Rule sets live in cleaner_rules/<name>.json as {"rules": [{"name", "pattern"}],
+    "extends": [...], "files": [glob, ...]}; a rule in a child set replaces a
+    parent rule of the same name. Patterns must not use named groups.
+    """
+
+    def __init__(self, name, rules):
+        self.name = name
+        self.rule_names = [rule["name"] for rule in rules]
+        for rule in rules:
+            re.compile(rule["pattern"])  # Fail on the offending rule, not the combined pattern
+        self.pattern = re.compile("|".join(f"(?P<r{i}>{rule['pattern']})" for i, rule in enumerate(rules)))
+
+    @staticmethod
+    def _read(name, rules_dir):
+        with open(os.path.join(rules_dir, f"{name}.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    @classmethod
+    def _resolve(cls, name, rules_dir, seen):
+        if name in seen:
+            raise ValueError(f"Circular 'extends' in cleaner rule set {name!r}")
+        config = cls._read(name, rules_dir)
+        rules = {}
+        for parent in config.get("extends", []):
+            rules.update(cls._resolve(parent, rules_dir, seen | {name}))
+        rules.update((rule["name"], rule) for rule in config.get("rules", []))
+        return rules
+
+    @classmethod
+    def load(cls, name=DEFAULT_RULE_SET, rules_dir=RULES_DIR):
+        return cls(name, list(cls._resolve(name, rules_dir, frozenset()).values()))
+
+    def match(self, text):
+        """Name of the rule that marks text as an artifact, or None."""
+        m = self.pattern.search(text)
+        return self.rule_names[int(m.lastgroup[1:])] if m else None
+
+
+def rule_set_for(input_file, rules_dir=RULES_DIR):
+    """Pick the rule set whose "files" globs match the input's file name."""
+    basename = os.path.basename(input_file).lower()
+    for filename in sorted(os.listdir(rules_dir)):
+        name = os.path.splitext(filename)[0]
+        if filename.endswith(".json") and any(
+            fnmatch.fnmatch(basename, glob) for glob in ArtifactRules._read(name, rules_dir).get("files", [])
+        ):
+            return name
+    return "common"
+
+
+class RuleStats:
+    """How many paragraphs, characters and (estimated) tokens each rule removed."""
+
+    def __init__(self):
+        self.rules = {}
+
+    def add(self, rule, text):
+        entry = self.rules.setdefault(rule, {"paragraphs": 0, "chars": 0})
+        entry["paragraphs"] += 1
+        entry["chars"] += len(text)
+
+    def as_dict(self):
+        rules = {name: {**entry, "tokens": entry["chars"] // CHARS_PER_TOKEN} for name, entry in self.rules.items()}
+        chars = sum(entry["chars"] for entry in rules.values())
+        return {"rules": rules, "removed_chars": chars, "removed_tokens": chars // CHARS_PER_TOKEN}
+
+
+_default_rules = None
+
+def is_pure_artifact(paragraph_text, rules=None):
     """Check if the paragraph is purely a formatting artifact."""
-    artifacts = [
-        r'^_+$',  # Just underscores
-        r'^-+$',  # Just dashes
-        r'^\s*Compilation No\. \d+ Compilation date: \d+/\d+/\d+\s*$',  # Just compilation info
-        r'^\s*$',  # Just whitespace
-        r'^Anti-Money Laundering and Counter-Terrorism Financing Act 2006\s*\d*\s*$'  # Footer line
-    ]
-    
-    return any(re.search(pattern, paragraph_text) for pattern in artifacts)
+    global _default_rules
+    if rules is None:
+        if _default_rules is None:
+            _default_rules = ArtifactRules.load()
+        rules = _default_rules
+    return rules.match(paragraph_text) is not None
 
 def clean_text(text):
     """Clean text while preserving ALL numbering and structure."""
     # Remove only extra whitespace between words
-    text = re.sub(r'[ \t]+', ' ', text)
+    text = WHITESPACE_PATTERN.sub(' ', text)
     
     # Remove trailing whitespace
     text = text.rstrip()
@@ -30,7 +115,7 @@ def clean_text(text):
     
     return text
 
-def clean_docx(input_file, output_file):
+def clean_docx(input_file, output_file, rules=None):
     try:
         # Load the document
         doc = Document(input_file)
@@ -46,7 +131,7 @@ def clean_docx(input_file, output_file):
             text = paragraph.text
             
             # Check if it's a pure formatting artifact
-            if is_pure_artifact(text):
+            if is_pure_artifact(text, rules):
                 prev_was_artifact = True
                 continue
             
@@ -89,6 +174,87 @@ def clean_docx(input_file, output_file):
     except Exception as e:
         print(f"Error processing file: {str(e)}")
 
+def paragraph_text(element):
+    """Plain text of a <w:p> element, keeping tabs and line breaks."""
+    parts = []
+    for node in element.iter():
+        if node.tag == W_T:
+            parts.append(node.text or "")
+        elif node.tag == W_TAB:
+            parts.append("\t")
+        elif node.tag in (W_BR, W_CR):
+            parts.append("\n")
+    return "".join(parts)
+
+def iter_docx_paragraphs(input_file):
+    """Stream paragraph texts straight from word/document.xml.
+
+    Processed elements are cleared as soon as they have been read, so memory
+    stays flat regardless of the size of the document.
+    """
+    with zipfile.ZipFile(input_file) as archive, archive.open("word/document.xml") as xml:
+        depth = 0
+        body = None
+        for event, element in ET.iterparse(xml, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if element.tag == W_BODY:
+                    body = element
+                continue
+            depth -= 1
+            if element.tag == W_P:
+                yield paragraph_text(element)
+                element.clear()
+            if body is not None and depth == 2:
+                # A top-level body element (paragraph/table) is finished
+                body.clear()
+
+def clean_docx_streaming(input_file, output_file, rules=None):
+    """Clean a docx into plain text, one paragraph per line, written incrementally."""
+    rules = rules or ArtifactRules.load(rule_set_for(input_file))
+    stats = RuleStats()
+    kept = kept_chars = 0
+    tmp_file = f"{output_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as out:
+        for text in iter_docx_paragraphs(input_file):
+            rule = rules.match(text)
+            if rule:
+                stats.add(rule, text)
+                continue
+            cleaned_text = clean_text(text)
+            if cleaned_text:
+                out.write(cleaned_text)
+                out.write("\n")
+                kept += 1
+                kept_chars += len(cleaned_text)
+    os.replace(tmp_file, output_file)
+    return {"input": input_file, "output": output_file, "rule_set": rules.name, "kept": kept,
+            "kept_chars": kept_chars, **stats.as_dict()}
+
+def _clean_one(job):
+    input_file, output_file, stream, rule_set = job
+    rules = ArtifactRules.load(rule_set or rule_set_for(input_file))
+    if stream:
+        return clean_docx_streaming(input_file, output_file, rules)
+    clean_docx(input_file, output_file, rules)
+    return {"input": input_file, "output": output_file, "rule_set": rules.name}
+
+def output_path(input_file, output_dir, stream):
+    stem = os.path.splitext(os.path.basename(input_file))[0].lower()
+    return os.path.join(output_dir or os.path.dirname(input_file), f"{stem}cleaned.{'txt' if stream else 'docx'}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Strip running headers/footers and other artifacts from legislation docx files.")
+    parser.add_argument("inputs", nargs="*", help="Input .docx files (default: ASIC2.docx).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream paragraphs from the document XML and write plain text (<name>cleaned.txt).")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument("--output-dir", default=None, help="Output directory (default: next to each input).")
+    parser.add_argument("--rules", default=None,
+                        help="Artifact rule set in cleaner_rules/ (default: chosen from each file name).")
+    parser.add_argument("--report", default=None, help="Write per-rule removal statistics to this JSON file.")
+    return parser.parse_args()
+
 def main():
     try:
         # Make sure python-docx is installed
@@ -97,9 +263,26 @@ def main():
         print("Please install python-docx first: pip install python-docx")
         return
 
-    input_file = "ASIC2.docx"
-    output_file = "asic2cleaned.docx"
-    clean_docx(input_file, output_file)
+    args = parse_args()
+    if not args.inputs:
+        clean_docx("ASIC2.docx", "asic2cleaned.docx", ArtifactRules.load(rule_set_for("ASIC2.docx")))
+        return
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    jobs = [(path, output_path(path, args.output_dir, args.stream), args.stream, args.rules) for path in args.inputs]
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(jobs)))) as pool:
+        for result in pool.map(_clean_one, jobs):
+            results.append(result)
+            if "kept" in result:
+                print(f"{result['input']} -> {result['output']} [{result['rule_set']}]: kept {result['kept']} paragraphs, "
+                      f"removed {result['removed_chars']} chars (~{result['removed_tokens']} tokens)")
+                for rule, entry in sorted(result["rules"].items(), key=lambda item: -item[1]["chars"]):
+                    print(f"    {rule:32} {entry['paragraphs']:6} paragraphs {entry['chars']:8} chars ~{entry['tokens']} tokens")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from artifacts import estimate_tokens
+from chains import MODEL_NAME
+
+# "gemini" caches prefixes provider-side; "local" only tracks reuse; "off" disables
+CONTEXT_CACHE_BACKEND = os.getenv("CONTEXT_CACHE_BACKEND", "local")
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+# Entries are refreshed this long before the provider would expire them
+EXPIRY_MARGIN = 60
+
+CachedContext = namedtuple("CachedContext", ["key", "name", "path", "version", "tokens", "expires_at"])
+
+
+def context_key(kind, system_prompt, master_version, model):
+    """Content address of a shared prompt prefix: system prompt + one version of an act."""
+    digest = hashlib.sha256()
+    for part in (kind, hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(), master_version, model):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LocalContextCache:
+    """Registry of the (system prompt, legislation) prefixes in use, with TTL and invalidation.
+
+    The local backend keeps no provider state: ``name`` is always None, so
+    chains send the full prefix, but hits and reusable prefix tokens are
+    counted the same way as with provider-side caching.
+    """
+
+    backend = "local"
+
+    def __init__(self, ttl=CONTEXT_CACHE_TTL, model=MODEL_NAME):
+        self.ttl = ttl
+        self.model = model
+        self.entries = {}
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0, "cached_tokens": 0}
+        self._creating = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind, system_prompt, master):
+        """Cached prefix for ``kind`` ("analysis", "chat") over a MasterDocument, creating it if needed.
+
+        The provider call that creates a prefix runs outside the lock, so a
+        slow upload only holds up callers asking for the same prefix.
+        """
+        key = context_key(kind, system_prompt, master.version, self.model)
+        while True:
+            with self._lock:
+                # A new version of the act makes every prefix built on the old one useless
+                for old in [e for e in self.entries.values() if e.path == master.path and e.version != master.version]:
+                    self._drop(old)
+                entry = self.entries.get(key)
+                if entry is not None and entry.expires_at <= time.time():
+                    self._drop(entry)
+                    entry = None
+                if entry is not None:
+                    if self._reused(entry):
+                        self.counters["hits"] += 1
+                        self.counters["cached_tokens"] += entry.tokens
+                    else:
+                        self.counters["misses"] += 1
+                    return entry
+                creating = self._creating.get(key)
+                if creating is None:
+                    # This caller creates the prefix; others asking for it wait for the result
+                    creating = self._creating[key] = threading.Event()
+                    self.counters["misses"] += 1
+                    break
+            creating.wait()
+
+        try:
+            name = self._create(key, system_prompt, master.text)
+            tokens = estimate_tokens(system_prompt) + estimate_tokens(master.text)
+            entry = CachedContext(key, name, master.path, master.version, tokens,
+                                  time.time() + self.ttl - min(EXPIRY_MARGIN, self.ttl // 2))
+            with self._lock:
+                self.entries[key] = entry
+        finally:
+            with self._lock:
+                self._creating.pop(key).set()
+        return entry
+
+    def invalidate(self, path=None):
+        """Drop the cached prefixes for one master document, or all of them."""
+        with self._lock:
+            for entry in [e for e in self.entries.values() if path is None or e.path == path]:
+                self._drop(entry)
+
+    def _drop(self, entry):
+        self.entries.pop(entry.key, None)
+        self.counters["invalidations"] += 1
+        if entry.name:
+            self._delete(entry.name)
+
+    def _reused(self, entry):
+        return True
+
+    def _create(self, key, system_prompt, legislation):
+        return None
+
+    def _delete(self, name):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.backend, "entries": len(self.entries), **self.counters}
+
+
+class GeminiContextCache(LocalContextCache):
+    """Provider-side context caching through the Gemini CachedContent API.
+
+    If the provider refuses a prefix (too short for caching, unsupported
+    model), the entry is kept without a name until its TTL runs out, so the
+    chain falls back to sending the prefix itself.
+    """
+
+    backend = "gemini"
+
+    def __init__(self, api_key=None, ttl=CONTEXT_CACHE_TTL, model=MODEL_NAME):
+        super().__init__(ttl, model)
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key or os.getenv("GOOGLE_API_KEY"))
+
+    def _reused(self, entry):
+        # An entry the provider refused has no name, and the chain sends the prefix itself
+        return entry.name is not None
+
+    def _create(self, key, system_prompt, legislation):
+        from google.generativeai import caching
+
+        try:
+            cached = caching.CachedContent.create(
+                model=f"models/{self.model}",
+                display_name=f"policy-{key[:16]}",
+                system_instruction=system_prompt,
+                contents=[{"role": "user", "parts": [{"text": f"Company Policy: {legislation}"}]}],
+                ttl=timedelta(seconds=self.ttl),
+            )
+        except Exception as e:
+            print(f"context cache: provider caching unavailable ({e}); sending full prompts", file=sys.stderr)
+            return None
+        return cached.name
+
+    def _delete(self, name):
+        from google.generativeai import caching
+
+        try:
+            caching.CachedContent.get(name).delete()
+        except Exception:
+            # Already expired or deleted on the provider side
+            pass
+
+
+def get_context_cache(backend=CONTEXT_CACHE_BACKEND, api_key=None):
+    """Context cache for the configured backend, or None when caching is off."""
+    if backend == "off":
+        return None
+    if backend == "gemini":
+        return GeminiContextCache(api_key)
+    return LocalContextCache()
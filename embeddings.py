@@ -0,0 +1,82 @@
+import hashlib
+import os
+import re
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Which backend get_embeddings() returns when none is requested
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hashing")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic, fully offline embeddings using signed feature hashing.
+
+    Unigrams and bigrams are hashed into a fixed number of dimensions and
+    the vector is L2-normalised, so inner product equals cosine similarity.
+    """
+
+    def __init__(self, dim=768):
+        self.dim = dim
+
+    def _embed(self, text):
+        words = WORD_PATTERN.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._embed(t).tolist() for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text).tolist()
+
+
+def _huggingface():
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL, encode_kwargs={"normalize_embeddings": True}
+    )
+
+
+def _google():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+
+
+BACKENDS = {
+    "hashing": HashingEmbeddings,
+    "huggingface": _huggingface,
+    "google": _google,
+}
+
+
+def get_embeddings(backend=None):
+    """Return an embeddings instance for the named (or configured) backend."""
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; choose from {sorted(BACKENDS)}")
+    return BACKENDS[backend]()
+
+
+def backend_fingerprint(embeddings):
+    """Stable identifier used to tell whether a stored index matches the backend."""
+    detail = (
+        getattr(embeddings, "model_name", None)
+        or getattr(embeddings, "model", None)
+        or getattr(embeddings, "dim", "")
+    )
+    backend_id = f"{type(embeddings).__name__}-{detail}"
+    return hashlib.sha256(backend_id.encode("utf-8")).hexdigest()[:16]
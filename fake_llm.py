@@ -0,0 +1,72 @@
+import hashlib
+import os
+import re
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.2"))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "200"))
+CHARS_PER_TOKEN = 4
+
+WORD_PATTERN = re.compile(r"\b[A-Za-z][A-Za-z-]{5,}")
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic offline stand-in for ChatGoogleGenerativeAI.
+
+    Replies are derived from a hash of the prompt, take ``latency`` seconds
+    to start and stream at ``tokens_per_second``. They use the report
+    headings so the section parser and report merge behave as with Gemini.
+    """
+
+    latency: float = FAKE_LLM_LATENCY
+    tokens_per_second: float = FAKE_LLM_TOKENS_PER_SECOND
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _reply(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        last = str(messages[-1].content) if messages else ""
+        # Terms from the request itself, so replies differ between documents
+        request = "\n".join(str(m.content) for m in messages if m.type != "system")
+        terms = list(dict.fromkeys(w.lower() for w in WORD_PATTERN.findall(request[-4000:])))[:6] or ["policy"]
+        if "###" not in last and "Report" not in last:
+            return (f"Based on the policy, {terms[0]} is addressed in the relevant sections "
+                    f"(ref {digest[:8]}). Please check the report for details on {', '.join(terms[1:3]) or 'it'}.")
+        severity = ("Low", "Medium", "High")[int(digest[0], 16) % 3]
+        return "\n".join([
+            "### Aligned Provisions",
+            f"- The document covers {terms[0]} in line with s{int(digest[1:3], 16) % 40 + 1}.",
+            "### Gaps/Discrepancies",
+            f"- No clear procedure for {terms[min(1, len(terms) - 1)]}.",
+            "### Compliance Risks",
+            f"- Incomplete {terms[min(2, len(terms) - 1)]} controls ({severity} severity).",
+            "### Recommendations",
+            f"- Document the {terms[min(3, len(terms) - 1)]} process and assign an owner.",
+        ])
+
+    def _chunks(self, text):
+        words = re.findall(r"\S+\s*", text)
+        delay = CHARS_PER_TOKEN / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        time.sleep(self.latency)
+        for word in words:
+            if delay:
+                time.sleep(delay * max(1, len(word) // CHARS_PER_TOKEN))
+            yield word
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = "".join(self._chunks(self._reply(messages)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for word in self._chunks(self._reply(messages)):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word))
+            if run_manager:
+                run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
@@ -0,0 +1,25 @@
+import io
+
+from langchain_core.documents import Document
+
+from tracing import span
+
+
+def extract_pdf_pages(data, source="upload.pdf", progress=None):
+    """Extract one Document per page from PDF bytes, entirely in memory.
+
+    Nothing is written to disk, so concurrent sessions never share state.
+    ``progress(done, total)`` is called after each page is extracted.
+    """
+    from pypdf import PdfReader
+
+    with span("pdf_ingest", source=source, bytes=len(data)) as current:
+        reader = PdfReader(io.BytesIO(data))
+        total = len(reader.pages)
+        current.attributes["pages"] = total
+        pages = []
+        for i, page in enumerate(reader.pages):
+            pages.append(Document(page_content=page.extract_text() or "", metadata={"source": source, "page": i}))
+            if progress:
+                progress(i + 1, total)
+        return pages
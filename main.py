@@ -1,41 +1,22 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from dotenv import load_dotenv
-from langchain_core.prompts import ChatPromptTemplate
-from prompt import prompt,cp
-from langchain_core.output_parsers import StrOutputParser
-load_dotenv()
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-    api_key=''
-    # other params...
-)
-from langchain_community.document_loaders import Docx2txtLoader
+import os
 
-loader = Docx2txtLoader("./cleaned_document.docx")
+from dotenv import load_dotenv
 
-data = loader.load()
+from chains import build_analysis_chain, get_llm
+from corpus import POLICY_AREA_PATHS, load_master_data
+from prompt import cp
 
-prompt = ChatPromptTemplate.from_messages(
-    [
-        (
-            "system",
-            prompt,
-        ),
-        ("human", "here is the {company_policy}"),
-    ]
-)
+# One-shot check of the sample policy in prompt.py against the AML Act.
+# For auditing a directory of documents use batch.py.
+load_dotenv()
+llm = get_llm(os.getenv("GOOGLE_API_KEY"))
 
-chain = prompt | llm | StrOutputParser()
+chain = build_analysis_chain(llm)
 
-response  = chain.invoke(
+response = chain.invoke(
     {
-        "legislation": data,
-        "company_policy": cp,
-      
+        "company_policy": load_master_data(POLICY_AREA_PATHS["AML"]),
+        "document_content": cp,
     }
 )
-print(response)
\ No newline at end of file
+print(response)
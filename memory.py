@@ -0,0 +1,128 @@
+import os
+import re
+import time
+from collections import deque
+
+from artifacts import estimate_tokens
+
+# Messages sent to the model verbatim; older ones are folded into the running summary
+CHAT_WINDOW_MESSAGES = int(os.getenv("CHAT_WINDOW_MESSAGES", "8"))
+# Token budget for the recent messages, the summary, and not-yet-summarised messages
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "3000"))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "600"))
+CHAT_PENDING_TOKENS = int(os.getenv("CHAT_PENDING_TOKENS", "600"))
+# Rendered messages kept for the chat panel
+CHAT_DISPLAY_MESSAGES = int(os.getenv("CHAT_DISPLAY_MESSAGES", "50"))
+
+CHARS_PER_TOKEN = 4
+NO_HISTORY = "No earlier messages."
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def clip(text, tokens):
+    """Cut text to about ``tokens`` tokens, at a word boundary."""
+    if estimate_tokens(text) <= tokens:
+        return text
+    return text[:tokens * CHARS_PER_TOKEN].rsplit(" ", 1)[0] + " …"
+
+
+def brief(message, tokens=60):
+    """One line standing in for a message: its first sentence, clipped."""
+    first = SENTENCE_END.split(message["content"].strip(), 1)[0]
+    return f"{message['role'].capitalize()}: {clip(' '.join(first.split()), tokens)}"
+
+
+def render(message):
+    """The chat panel's HTML for one message, built once when it is added."""
+    timestamp = time.strftime("%I:%M %p", time.localtime(message["time"]))
+    return (f'<div style="display: flex; justify-content: {"flex-end" if message["role"] == "user" else "flex-start"};">'
+            f'<div class="chat-message {message["role"]}-message" role="log" aria-label="{message["role"]} message">'
+            f'{message["content"]} <span style="font-size: 12px; color: #888;">{timestamp}</span></div></div>')
+
+
+class ChatMemory:
+    """Bounded conversation memory for one chat session.
+
+    The last ``window`` messages are kept verbatim; older ones move to
+    ``pending`` until a summariser folds them into ``summary`` (see
+    summary_inputs() and summarised()). context() gives the model all three
+    within ``max_tokens``, so a long session costs the same per turn as a
+    short one. ``display`` keeps each message's rendered HTML for the chat
+    panel, capped at ``display_size``.
+    """
+
+    def __init__(self, greeting=None, window=CHAT_WINDOW_MESSAGES, max_tokens=CHAT_HISTORY_TOKENS,
+                 summary_tokens=CHAT_SUMMARY_TOKENS, pending_tokens=CHAT_PENDING_TOKENS,
+                 display_size=CHAT_DISPLAY_MESSAGES):
+        self.window = window
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.pending_tokens = pending_tokens
+        self.summary = ""
+        self.recent = []
+        self.pending = []
+        self.display = deque(maxlen=display_size)
+        self.count = 0
+        if greeting:
+            # Shown in the panel but not part of the conversation
+            self.display.append(render({"role": "assistant", "content": greeting, "time": time.time()}))
+
+    def add(self, role, content):
+        message = {"role": role, "content": content, "time": time.time()}
+        self.recent.append(message)
+        self.display.append(render(message))
+        self.count += 1
+        budget = self.max_tokens - self.summary_tokens - self.pending_tokens
+        while self.recent and (len(self.recent) > self.window or self._tokens(self.recent) > budget):
+            if len(self.recent) == 1:
+                # A single oversized message is clipped rather than dropped
+                self.recent[0]["content"] = clip(self.recent[0]["content"], budget)
+                break
+            self.pending.append(self.recent.pop(0))
+
+    @staticmethod
+    def _tokens(messages):
+        return sum(estimate_tokens(m["content"]) + 2 for m in messages)
+
+    def summary_inputs(self, max_words=None):
+        """Inputs for the summary chain, or None when nothing is waiting to be folded."""
+        if not self.pending:
+            return None
+        return {
+            "summary": self.summary or "None yet.",
+            "messages": "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in self.pending),
+            "max_words": max_words or self.summary_tokens * 3 // 4,
+        }
+
+    def summarised(self, summary, folded):
+        """Replace the summary with one covering the first ``folded`` pending messages."""
+        self.summary = clip(summary.strip(), self.summary_tokens)
+        del self.pending[:folded]
+
+    def fold(self):
+        """Fold pending messages into the summary without a model call (one line each)."""
+        lines = ([self.summary] if self.summary else []) + [brief(m) for m in self.pending]
+        # Keep the newest lines when over budget
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        self.summarised("\n".join(lines), len(self.pending))
+
+    def context(self):
+        """The conversation so far as prompt text, within ``max_tokens``."""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier messages:\n{self.summary}")
+        if self.pending:
+            # Not summarised yet: the newest first sentences that fit
+            lines = [brief(m) for m in self.pending]
+            while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.pending_tokens:
+                lines.pop(0)
+            parts.append("Earlier messages (abridged):\n" + "\n".join(lines))
+        if self.recent:
+            parts.append("Recent messages:\n" + "\n".join(f"{m['role'].capitalize()}: {m['content']}"
+                                                         for m in self.recent))
+        return "\n\n".join(parts) or NO_HISTORY
+
+    def stats(self):
+        return {"messages": self.count, "recent": len(self.recent), "pending": len(self.pending),
+                "summary_tokens": estimate_tokens(self.summary), "context_tokens": estimate_tokens(self.context())}
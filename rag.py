@@ -1,53 +1,152 @@
 import asyncio
+import json
 import os
+import re
 import sys
+
+import numpy as np
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.chains.summarize.chain import load_summarize_chain
-from langchain.docstore.document import Document
-from helper_functions import encode_pdf, encode_from_string
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-sys.path.append(os.path.abspath(os.path.join(os.getcwd(), '..')))  # Add the parent directory to the path
-from helper_functions import *
-from evaluation.evalute_rag import *
+from corpus import BASE_DIR, POLICY_AREA_PATHS, area_slug, get_master_document
+from embeddings import backend_fingerprint, get_embeddings
+from scheduler import embedding_scheduler, llm_scheduler
 
 # Load environment variables from a .env file
 load_dotenv()
 
-# Set the OpenAI API key environment variable
-os.environ["OPENAI_API_KEY"] = os.getenv('OPENAI_API_KEY')
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", os.path.join(BASE_DIR, "vector_stores"))
+INDEX_FORMAT_VERSION = 2
+
+# Docx legislation has no pages, so it is grouped into fixed-size "pages"
+PAGE_SIZE = 4000
+SUMMARY_CHARS = 600
+
+HEADING_PATTERN = re.compile(r"^(Part|Division|Subdivision|Schedule|Chapter)\b|^\d+[A-Z]*\s{1,2}\S")
+
+
+def index_dir(area):
+    return os.path.join(VECTOR_STORE_DIR, area_slug(area))
+
+
+def split_pages(text, source, page_size=PAGE_SIZE):
+    """Group a flat legislation text into page-sized Documents."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=page_size, chunk_overlap=0, length_function=len)
+    return [
+        Document(page_content=chunk, metadata={"source": source, "page": i})
+        for i, chunk in enumerate(splitter.split_text(text))
+    ]
+
+
+def extractive_summary(text, max_chars=SUMMARY_CHARS):
+    """Offline page summary: the headings on the page followed by its opening text."""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    headings = [line for line in lines if len(line) < 100 and HEADING_PATTERN.match(line)]
+    summary = "; ".join(headings)
+    if len(summary) < max_chars:
+        summary = (summary + "\n" if summary else "") + " ".join(lines)[: max_chars - len(summary)]
+    return summary[:max_chars]
+
+
+def extractive_summarizer():
+    async def summarize(doc):
+        return extractive_summary(doc.page_content)
+    return summarize
+
+
+def llm_summarizer():
+    """Summarize pages with Gemini (requires GOOGLE_API_KEY and network access)."""
+    from langchain.chains.summarize.chain import load_summarize_chain
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    summary_llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0, max_retries=2)
+    summary_chain = load_summarize_chain(summary_llm, chain_type="map_reduce")
+
+    async def summarize(doc):
+        output = await llm_scheduler.acall(lambda: summary_chain.ainvoke([doc]),
+                                           tokens=len(doc.page_content) // 4)
+        return output["output_text"]
+    return summarize
+
+
+SUMMARIZERS = {"extractive": extractive_summarizer, "llm": llm_summarizer}
+
+
+def load_pages(path, is_string=False):
+    """Load a PDF, docx or raw string as a list of page Documents."""
+    if is_string:
+        return split_pages(path, "string")
+    if path.lower().endswith(".pdf"):
+        from langchain_community.document_loaders import PyPDFLoader
+
+        return PyPDFLoader(path).load()
+    return split_pages(get_master_document(path).text, path)
+
+
+class PageChunkIndex:
+    """Page -> detail-chunk row mapping plus the normalised chunk embedding matrix.
+
+    Row i of ``vectors`` is FAISS row i (and chunk_id i) of the detailed store,
+    so detail retrieval can score only the chunks of the selected pages in one
+    matrix product instead of filtering the whole store per page.
+    """
+
+    def __init__(self, vectors, pages):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.where(norms == 0, 1, norms)
+        self.pages = np.asarray(pages, dtype=np.int64)
+        order = np.argsort(self.pages, kind="stable")
+        boundaries = np.flatnonzero(np.diff(self.pages[order])) + 1
+        self.page_rows = {
+            int(self.pages[rows[0]]): rows for rows in np.split(order, boundaries) if len(rows)
+        }
+
+    @classmethod
+    def from_vectorstore(cls, detailed_vectorstore):
+        index = detailed_vectorstore.index
+        vectors = index.reconstruct_n(0, index.ntotal)
+        docstore = detailed_vectorstore.docstore
+        pages = [
+            docstore.search(detailed_vectorstore.index_to_docstore_id[i]).metadata["page"]
+            for i in range(index.ntotal)
+        ]
+        return cls(vectors, pages)
+
+    def candidates(self, pages):
+        rows = [self.page_rows[p] for p in dict.fromkeys(pages) if p in self.page_rows]
+        return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "chunk_vectors.npy"), self.vectors)
+        np.save(os.path.join(directory, "chunk_pages.npy"), self.pages)
+
+    @classmethod
+    def load(cls, directory):
+        return cls(np.load(os.path.join(directory, "chunk_vectors.npy")),
+                   np.load(os.path.join(directory, "chunk_pages.npy")))
 
 
 # Function to encode to both summary and chunk levels, sharing the page metadata
-async def encode_pdf_hierarchical(path, chunk_size=1000, chunk_overlap=200, is_string=False):
+async def encode_pdf_hierarchical(path, chunk_size=1000, chunk_overlap=200, is_string=False,
+                                  embeddings=None, summarizer="extractive"):
     """
-    Asynchronously encodes a PDF book into a hierarchical vector store using OpenAI embeddings.
-    Includes rate limit handling with exponential backoff.
+    Asynchronously encodes a document (PDF, docx legislation or string) into
+    summary-level and chunk-level FAISS stores using a local embedding backend,
+    plus the page-to-chunk index used by retrieve_hierarchical.
     """
-    if not is_string:
-        loader = PyPDFLoader(path)
-        documents = await asyncio.to_thread(loader.load)
-    else:
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len, is_separator_regex=False
-        )
-        documents = text_splitter.create_documents([path])
-
-    summary_llm = ChatOpenAI(temperature=0, model_name="gpt-4o-mini", max_tokens=4000)
-    summary_chain = load_summarize_chain(summary_llm, chain_type="map_reduce")
+    embeddings = embeddings or get_embeddings()
+    documents = await asyncio.to_thread(load_pages, path, is_string)
+    summarize = SUMMARIZERS[summarizer]()
 
     async def summarize_doc(doc):
-        summary_output = await retry_with_exponential_backoff(summary_chain.ainvoke([doc]))
-        summary = summary_output['output_text']
-        return Document(page_content=summary, metadata={"source": path, "page": doc.metadata["page"], "summary": True})
-
-    summaries = []
-    batch_size = 5
-    for i in range(0, len(documents), batch_size):
-        batch = documents[i:i + batch_size]
-        batch_summaries = await asyncio.gather(*[summarize_doc(doc) for doc in batch])
-        summaries.extend(batch_summaries)
-        await asyncio.sleep(1)
+        summary = await summarize(doc)
+        return Document(page_content=summary, metadata={"source": doc.metadata.get("source", path),
+                                                        "page": int(doc.metadata["page"]), "summary": True})
+
+    # The LLM scheduler decides how many summaries run at once
+    summaries = await asyncio.gather(*[summarize_doc(doc) for doc in documents])
 
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len)
     detailed_chunks = await asyncio.to_thread(text_splitter.split_documents, documents)
@@ -55,70 +154,203 @@ async def encode_pdf_hierarchical(path, chunk_size=1000, chunk_overlap=200, is_s
     for i, chunk in enumerate(detailed_chunks):
         chunk.metadata.update({"chunk_id": i, "summary": False, "page": int(chunk.metadata.get("page", 0))})
 
-    embeddings = OpenAIEmbeddings()
+    from langchain_community.vectorstores import FAISS
 
-    async def create_vectorstore(docs):
-        return await retry_with_exponential_backoff(asyncio.to_thread(FAISS.from_documents, docs, embeddings))
+    def create_vectorstore(docs):
+        # Embed once and reuse the vectors for both FAISS and the page index
+        texts = [doc.page_content for doc in docs]
+        vectors = embedding_scheduler.call(lambda: embeddings.embed_documents(texts),
+                                           tokens=sum(len(text) for text in texts) // 4)
+        store = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings,
+                                      metadatas=[doc.metadata for doc in docs])
+        return store, vectors
 
-    summary_vectorstore, detailed_vectorstore = await asyncio.gather(
-        create_vectorstore(summaries),
-        create_vectorstore(detailed_chunks)
+    (summary_vectorstore, _), (detailed_vectorstore, chunk_vectors) = await asyncio.gather(
+        asyncio.to_thread(create_vectorstore, summaries),
+        asyncio.to_thread(create_vectorstore, detailed_chunks),
     )
+    page_index = PageChunkIndex(chunk_vectors, [chunk.metadata["page"] for chunk in detailed_chunks])
 
-    return summary_vectorstore, detailed_vectorstore
+    return summary_vectorstore, detailed_vectorstore, page_index
 
 
-def retrieve_hierarchical(query, summary_vectorstore, detailed_vectorstore, k_summaries=3, k_chunks=5):
+def retrieve_hierarchical(query, summary_vectorstore, detailed_vectorstore, k_summaries=3, k_chunks=5,
+                          page_index=None):
     """
     Performs a hierarchical retrieval using the query.
+
+    The query is embedded once; the top summaries select pages, and the
+    candidate chunks of those pages are scored in a single vectorised pass.
+    Returns deduplicated chunks (at most k_chunks per page) ranked by cosine
+    similarity, with the score in ``metadata["score"]``.
     """
-    top_summaries = summary_vectorstore.similarity_search(query, k=k_summaries)
+    if page_index is None:
+        page_index = PageChunkIndex.from_vectorstore(detailed_vectorstore)
+    query_vector = np.asarray(
+        embedding_scheduler.call(lambda: summary_vectorstore.embeddings.embed_query(query), tokens=len(query) // 4),
+        dtype=np.float32,
+    )
+    norm = np.linalg.norm(query_vector)
+    if norm:
+        query_vector /= norm
+
+    top_summaries = summary_vectorstore.similarity_search_by_vector(query_vector.tolist(), k=k_summaries)
+    rows = page_index.candidates([summary.metadata["page"] for summary in top_summaries])
+    if not len(rows):
+        return []
+
+    scores = page_index.vectors[rows] @ query_vector
+    order = np.argsort(-scores, kind="stable")
+    per_page = {}
     relevant_chunks = []
-    for summary in top_summaries:
-        page_number = summary.metadata["page"]
-        page_filter = lambda metadata: metadata["page"] == page_number
-        page_chunks = detailed_vectorstore.similarity_search(query, k=k_chunks, filter=page_filter)
-        relevant_chunks.extend(page_chunks)
+    for position in order:
+        row = int(rows[position])
+        page = int(page_index.pages[row])
+        if per_page.get(page, 0) >= k_chunks:
+            continue
+        per_page[page] = per_page.get(page, 0) + 1
+        chunk = detailed_vectorstore.docstore.search(detailed_vectorstore.index_to_docstore_id[row])
+        relevant_chunks.append(Document(page_content=chunk.page_content,
+                                        metadata={**chunk.metadata, "score": float(scores[position])}))
     return relevant_chunks
 
 
+def save_index(area, summary_store, detailed_store, page_index, meta):
+    directory = index_dir(area)
+    os.makedirs(directory, exist_ok=True)
+    summary_store.save_local(os.path.join(directory, "summary_store"))
+    detailed_store.save_local(os.path.join(directory, "detailed_store"))
+    page_index.save(directory)
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_index(area, data_path=None, embeddings=None):
+    """Load the persisted stores for a policy area, or None if missing or stale."""
+    data_path = data_path or POLICY_AREA_PATHS[area]
+    embeddings = embeddings or get_embeddings()
+    directory = index_dir(area)
+    meta_path = os.path.join(directory, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    if (meta.get("format") != INDEX_FORMAT_VERSION
+            or meta.get("embeddings") != backend_fingerprint(embeddings)
+            or (os.path.exists(data_path) and meta.get("source_version") != get_master_document(data_path).version)):
+        return None
+    from langchain_community.vectorstores import FAISS
+
+    summary_store = FAISS.load_local(os.path.join(directory, "summary_store"), embeddings,
+                                     allow_dangerous_deserialization=True)
+    detailed_store = FAISS.load_local(os.path.join(directory, "detailed_store"), embeddings,
+                                      allow_dangerous_deserialization=True)
+    return summary_store, detailed_store, PageChunkIndex.load(directory)
+
+
+async def build_index(area, data_path=None, chunk_size=1000, chunk_overlap=200,
+                      embeddings=None, summarizer="extractive"):
+    """Encode a policy area's master document and persist its stores."""
+    data_path = data_path or POLICY_AREA_PATHS[area]
+    embeddings = embeddings or get_embeddings()
+    stores = await encode_pdf_hierarchical(
+        data_path, chunk_size, chunk_overlap, embeddings=embeddings, summarizer=summarizer
+    )
+    save_index(area, *stores, {
+        "format": INDEX_FORMAT_VERSION,
+        "area": area,
+        "source": os.path.basename(data_path),
+        "source_version": get_master_document(data_path).version,
+        "embeddings": backend_fingerprint(embeddings),
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "summarizer": summarizer,
+    })
+    return stores
+
+
 class HierarchicalRAG:
-    def __init__(self, pdf_path, chunk_size=1000, chunk_overlap=200):
-        self.pdf_path = pdf_path
+    def __init__(self, area, data_path=None, chunk_size=1000, chunk_overlap=200, embeddings=None):
+        self.area = area
+        self.data_path = data_path or POLICY_AREA_PATHS[area]
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.embeddings = embeddings or get_embeddings()
         self.summary_store = None
         self.detailed_store = None
+        self.page_index = None
+
+    def load(self):
+        """Load the prebuilt stores; returns False when they need (re)building."""
+        stores = load_index(self.area, self.data_path, self.embeddings)
+        if stores is None:
+            return False
+        self.summary_store, self.detailed_store, self.page_index = stores
+        return True
+
+    async def ensure_index(self, summarizer="extractive"):
+        if self.summary_store is None and not self.load():
+            self.summary_store, self.detailed_store, self.page_index = await build_index(
+                self.area, self.data_path, self.chunk_size, self.chunk_overlap,
+                embeddings=self.embeddings, summarizer=summarizer
+            )
+
+    def retrieve(self, query, k_summaries=3, k_chunks=5):
+        return retrieve_hierarchical(query, self.summary_store, self.detailed_store, k_summaries, k_chunks,
+                                     page_index=self.page_index)
 
     async def run(self, query):
-        if os.path.exists("../vector_stores/summary_store") and os.path.exists("../vector_stores/detailed_store"):
-            embeddings = OpenAIEmbeddings()
-            self.summary_store = FAISS.load_local("../vector_stores/summary_store", embeddings, allow_dangerous_deserialization=True)
-            self.detailed_store = FAISS.load_local("../vector_stores/detailed_store", embeddings, allow_dangerous_deserialization=True)
-        else:
-            self.summary_store, self.detailed_store = await encode_pdf_hierarchical(self.pdf_path, self.chunk_size, self.chunk_overlap)
-            self.summary_store.save_local("../vector_stores/summary_store")
-            self.detailed_store.save_local("../vector_stores/detailed_store")
-
-        results = retrieve_hierarchical(query, self.summary_store, self.detailed_store)
-        for chunk in results:
-            print(f"Page: {chunk.metadata['page']}")
+        await self.ensure_index()
+        for chunk in self.retrieve(query):
+            print(f"Page: {chunk.metadata['page']}  Score: {chunk.metadata['score']:.3f}")
             print(f"Content: {chunk.page_content}...")
             print("---")
 
 
+def load_all_indexes(areas=None, embeddings=None):
+    """Load every prebuilt policy-area index; areas without one are skipped."""
+    embeddings = embeddings or get_embeddings()
+    indexes = {}
+    for area in areas or POLICY_AREA_PATHS:
+        rag = HierarchicalRAG(area, embeddings=embeddings)
+        if rag.load():
+            indexes[area] = rag
+    return indexes
+
+
 def parse_args():
     import argparse
-    parser = argparse.ArgumentParser(description="Run Hierarchical RAG on a given PDF.")
-    parser.add_argument("--pdf_path", type=str, default="../data/Understanding_Climate_Change.pdf", help="Path to the PDF document.")
-    parser.add_argument("--chunk_size", type=int, default=1000, help="Size of each text chunk.")
-    parser.add_argument("--chunk_overlap", type=int, default=200, help="Overlap between consecutive chunks.")
-    parser.add_argument("--query", type=str, default='What is the greenhouse effect',
-                        help="Query to search in the document.")
+    parser = argparse.ArgumentParser(description="Build or query the hierarchical legislation indexes.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Build and persist indexes for policy areas.")
+    build.add_argument("--areas", nargs="+", default=list(POLICY_AREA_PATHS), choices=list(POLICY_AREA_PATHS))
+    build.add_argument("--chunk_size", type=int, default=1000, help="Size of each text chunk.")
+    build.add_argument("--chunk_overlap", type=int, default=200, help="Overlap between consecutive chunks.")
+    build.add_argument("--summarizer", choices=sorted(SUMMARIZERS), default="extractive")
+    build.add_argument("--embeddings", default=None, help="Embedding backend (default: $EMBEDDING_BACKEND).")
+
+    query = subparsers.add_parser("query", help="Query a policy area's index.")
+    query.add_argument("--area", default="AML", choices=list(POLICY_AREA_PATHS))
+    query.add_argument("--embeddings", default=None, help="Embedding backend (default: $EMBEDDING_BACKEND).")
+    query.add_argument("query", help="Query to search in the legislation.")
     return parser.parse_args()
 
 
+async def build_all(args):
+    embeddings = get_embeddings(args.embeddings)
+    for area in args.areas:
+        await build_index(area, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+                          embeddings=embeddings, summarizer=args.summarizer)
+        print(f"Built index for {area} in {index_dir(area)}")
+
+
 if __name__ == "__main__":
     args = parse_args()
-    rag = HierarchicalRAG(args.pdf_path, args.chunk_size, args.chunk_overlap)
-    asyncio.run(rag.run(args.query))
\ No newline at end of file
+    if args.command == "build":
+        asyncio.run(build_all(args))
+    else:
+        rag = HierarchicalRAG(args.area, embeddings=get_embeddings(args.embeddings))
+        if not rag.load():
+            sys.exit(f"No prebuilt index for {args.area}; run `python rag.py build --areas {args.area!r}` first.")
+        asyncio.run(rag.run(args.query))
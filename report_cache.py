@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import threading
+
+from corpus import BASE_DIR
+
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join(BASE_DIR, ".report_cache"))
+# Total size of cached reports before the least recently used are evicted
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+# Per-section findings of sectioned analyses, reused when a revised document keeps a section unchanged
+SECTION_CACHE_MAX_BYTES = int(os.getenv("SECTION_CACHE_MAX_BYTES", str(20 * 1024 * 1024)))
+
+
+def report_key(document_hash, master_version, system_prompt, model, temperature, mode="full"):
+    """Content address for a report: same inputs, same model settings, same key.
+
+    ``document_hash`` is the sha256 hex digest of the uploaded file's bytes.
+    """
+    digest = hashlib.sha256()
+    for part in (
+        document_hash,
+        master_version,
+        hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+        model,
+        repr(float(temperature)),
+        mode,
+    ):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ReportCache:
+    """Persistent, size-bounded LRU cache of generated compliance reports.
+
+    Each report is one file (``suffix``) named by its key; access time is
+    tracked through the file mtime, and hit/miss counters are kept in stats.json.
+    """
+
+    def __init__(self, directory=REPORT_CACHE_DIR, max_bytes=REPORT_CACHE_MAX_BYTES, suffix=".md"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def __contains__(self, key):
+        # Checked without touching the entry or the hit/miss counters
+        return os.path.exists(self._path(key))
+
+    def _count(self, field):
+        stats = self.stats()
+        stats[field] = stats.get(field, 0) + 1
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = os.path.join(self.directory, f"stats.json.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(stats, f)
+        os.replace(tmp, os.path.join(self.directory, "stats.json"))
+
+    def get(self, key):
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    report = f.read()
+                os.utime(path)
+            except FileNotFoundError:
+                self._count("misses")
+                return None
+            self._count("hits")
+            return report
+
+    def put(self, key, report):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self._path(key) + f".{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(report)
+            os.replace(tmp, self._path(key))
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        try:
+            with open(os.path.join(self.directory, "stats.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"hits": 0, "misses": 0}
+
+
+report_cache = ReportCache()
+section_cache = ReportCache(os.path.join(REPORT_CACHE_DIR, "sections"), SECTION_CACHE_MAX_BYTES, suffix=".json")
@@ -0,0 +1,130 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from artifacts import load_artifact
+from corpus import MAX_CACHED_DOCUMENTS, get_master_document
+from structure import get_act_index
+from tracing import traced
+
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 200
+RETRIEVAL_TOP_K = 6
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['’][a-z]+)?")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was
+were will with what which who does do not any may must if under about can should
+""".split())
+
+
+def tokenize(text):
+    """Lower-case word tokens with stopwords removed."""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def section_spans(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """(start, end) character offsets of the overlapping sections of a master document."""
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len, add_start_index=True
+    )
+    return [
+        (doc.metadata["start_index"], doc.metadata["start_index"] + len(doc.page_content))
+        for doc in splitter.create_documents([text])
+        if doc.metadata["start_index"] >= 0
+    ]
+
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Split a master document into overlapping sections."""
+    return [text[start:end] for start, end in section_spans(text, chunk_size, chunk_overlap)]
+
+
+class BM25Index:
+    """In-memory Okapi BM25 index over the sections of one document."""
+
+    def __init__(self, chunks, k1=1.5, b=0.75, labels=None):
+        self.chunks = chunks
+        self.labels = labels or [None] * len(chunks)
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for i, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    def search(self, query, k=RETRIEVAL_TOP_K):
+        """Return the top-k (chunk_index, score) pairs for a query."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_index(data_path):
+    """Return the BM25 index for a master document, building it once per version."""
+    document = get_master_document(data_path)
+    key = (document.path, document.version)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    artifact = load_artifact(document.path)
+    if artifact is not None and artifact.version == document.version:
+        spans = [(s["start"], s["end"]) for s in artifact.sections]
+    else:
+        spans = section_spans(document.text)
+    # Label each chunk with the act section it starts in, for citations
+    act_index = get_act_index(data_path)
+    citations = [act_index.citation_at(start) for start, _ in spans]
+    labels = [None if node is act_index.root else node.label for node in citations]
+    index = BM25Index([document.text[start:end] for start, end in spans], labels=labels)
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_CACHED_DOCUMENTS:
+            _indexes.popitem(last=False)
+    return index
+
+
+@traced("retrieve_sections")
+def retrieve_sections(data_path, query, k=RETRIEVAL_TOP_K):
+    """Return the k sections of a master document most relevant to the query."""
+    index = get_index(data_path)
+    hits = index.search(query, k=k)
+    # Keep document order so the excerpts read naturally
+    return [
+        f"[{index.labels[i]}]\n{index.chunks[i]}" if index.labels[i] else index.chunks[i]
+        for i, _ in sorted(hits)
+    ]
+
+
+def format_sections(sections):
+    """Render retrieved sections as the legislation context for a prompt."""
+    if not sections:
+        return "No sections of the legislation matched this question."
+    body = "\n\n---\n\n".join(f"[Excerpt {i}]\n{s}" for i, s in enumerate(sections, 1))
+    return f"Relevant excerpts of the legislation (not the full text):\n\n{body}"
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+
+RATE_LIMIT_MARKERS = ("429", "resource exhausted", "resourceexhausted", "rate limit", "quota", "too many requests")
+
+
+def is_rate_limited(exc):
+    """True when an exception looks like a provider rate-limit / quota error."""
+    text = f"{type(exc).__name__} {exc}".lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+
+class Scheduler:
+    """Shared budget for calls to one provider endpoint.
+
+    Calls are admitted while the last minute's requests and tokens are under
+    ``rpm``/``tpm`` and fewer than ``limit`` calls are in flight. The limit
+    grows additively on success and halves on a rate-limit error (AIMD), and
+    rate-limited calls are retried with jittered exponential backoff.
+    Works from threads (call) and from asyncio code (acall).
+    """
+
+    def __init__(self, name, rpm, tpm, max_concurrency, min_concurrency=1, base_delay=1.0, max_delay=60.0):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.window = deque()  # (admitted_at, tokens) for the last 60s
+        self.window_tokens = 0
+        self.paused_until = 0.0
+        self.counters = {"calls": 0, "rate_limited": 0, "retries": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens):
+        """Admit a call and return 0, or return how long to wait before trying again."""
+        now = time.monotonic()
+        with self._lock:
+            while self.window and now - self.window[0][0] >= 60:
+                self.window_tokens -= self.window.popleft()[1]
+            # One request bigger than the whole budget is let through on an empty window
+            tokens = min(tokens, self.tpm)
+            waits = [self.paused_until - now]
+            if self.in_flight >= int(self.limit):
+                waits.append(0.05)
+            if len(self.window) >= self.rpm:
+                waits.append(60 - (now - self.window[0][0]))
+            if self.window and self.window_tokens + tokens > self.tpm:
+                waits.append(60 - (now - self.window[0][0]))
+            wait = max(waits)
+            if wait > 0:
+                return wait
+            self.in_flight += 1
+            self.window.append((now, tokens))
+            self.window_tokens += tokens
+            self.counters["calls"] += 1
+            return 0
+
+    def _release(self, exc=None):
+        with self._lock:
+            self.in_flight -= 1
+            if exc is not None and is_rate_limited(exc):
+                self.counters["rate_limited"] += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+            elif exc is None:
+                # +1 slot after roughly one full window of successful calls
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def _backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * (0.5 + random.random())
+        with self._lock:
+            # Everyone waits out the provider's rate limit, not just the failed call
+            self.paused_until = max(self.paused_until, time.monotonic() + delay / 2)
+        return delay
+
+    def call(self, fn, tokens=0, max_retries=5, retry_on=is_rate_limited):
+        """Run fn() within the budget, retrying errors matching ``retry_on``."""
+        for attempt in range(max_retries + 1):
+            wait = self._try_acquire(tokens)
+            while wait > 0:
+                time.sleep(min(wait, 1.0))
+                wait = self._try_acquire(tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                self._release(e)
+                if attempt == max_retries or not retry_on(e):
+                    with self._lock:
+                        self.counters["failures"] += 1
+                    raise
+                with self._lock:
+                    self.counters["retries"] += 1
+                time.sleep(self._backoff(attempt))
+            else:
+                self._release()
+                return result
+
+    async def acall(self, make_call, tokens=0, max_retries=5, retry_on=is_rate_limited):
+        """Await make_call() within the budget, retrying errors matching ``retry_on``."""
+        for attempt in range(max_retries + 1):
+            wait = self._try_acquire(tokens)
+            while wait > 0:
+                await asyncio.sleep(min(wait, 1.0))
+                wait = self._try_acquire(tokens)
+            try:
+                result = await make_call()
+            except asyncio.CancelledError:
+                with self._lock:
+                    self.in_flight -= 1
+                raise
+            except Exception as e:
+                self._release(e)
+                if attempt == max_retries or not retry_on(e):
+                    with self._lock:
+                        self.counters["failures"] += 1
+                    raise
+                with self._lock:
+                    self.counters["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt))
+            else:
+                self._release()
+                return result
+
+    def stats(self):
+        with self._lock:
+            return {"name": self.name, "concurrency_limit": round(self.limit, 2), "in_flight": self.in_flight,
+                    "requests_last_minute": len(self.window), "tokens_last_minute": self.window_tokens,
+                    **self.counters}
+
+
+# Process-wide budgets, one per provider quota
+llm_scheduler = Scheduler(
+    "llm",
+    rpm=int(os.getenv("LLM_RPM", "60")),
+    tpm=int(os.getenv("LLM_TPM", "1000000")),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+)
+embedding_scheduler = Scheduler(
+    "embeddings",
+    rpm=int(os.getenv("EMBEDDING_RPM", "1500")),
+    tpm=int(os.getenv("EMBEDDING_TPM", "1000000")),
+    max_concurrency=int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4")),
+)
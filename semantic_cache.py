@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embeddings import get_embeddings
+from retrieval import STOPWORDS, TOKEN_PATTERN
+
+# Cosine similarity at or above which a stored answer is reused
+CHAT_CACHE_THRESHOLD = float(os.getenv("CHAT_CACHE_THRESHOLD", "0.9"))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "1000"))
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", str(24 * 3600)))
+# Questions are embedded locally; "hashing" needs no model download or API call
+CHAT_CACHE_EMBEDDING_BACKEND = os.getenv("CHAT_CACHE_EMBEDDING_BACKEND", "hashing")
+
+# Negation and modal words flip a compliance answer ("must" vs "may not"), so unlike
+# retrieval they are kept, and two questions only match if they use the same ones
+POLARITY_WORDS = frozenset("""
+not no never nor without cannot can't won't don't doesn't isn't aren't shouldn't mustn't needn't
+must may might should can could shall will would need needs required any if unless under except only
+""".split())
+CACHE_STOPWORDS = STOPWORDS - POLARITY_WORDS
+
+
+def normalize(question):
+    """Lower-case question tokens with filler words dropped, keeping negation and modals."""
+    return [t for t in TOKEN_PATTERN.findall(question.lower()) if t not in CACHE_STOPWORDS]
+
+
+def polarity(tokens):
+    return frozenset(t for t in tokens if t in POLARITY_WORDS or t.endswith(("n't", "n’t")))
+
+
+class SemanticChatCache:
+    """Process-wide cache of chat answers, matched on question similarity.
+
+    Answers are only shared between questions asked in the same scope:
+    policy area, master document version, report hash and context mode.
+    The least recently used answers are evicted past ``max_entries``, and
+    answers older than ``ttl`` seconds are never returned.
+    """
+
+    def __init__(self, threshold=CHAT_CACHE_THRESHOLD, max_entries=CHAT_CACHE_MAX_ENTRIES, ttl=CHAT_CACHE_TTL,
+                 embeddings=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embeddings = embeddings or get_embeddings(CHAT_CACHE_EMBEDDING_BACKEND)
+        # (scope, question) -> (vector, answer, created_at, polarity), in LRU order
+        self.entries = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def scope(policy_area, master_version, report_hash, mode="full"):
+        return (policy_area, master_version, report_hash, mode)
+
+    def _embed(self, tokens):
+        # Filler words and punctuation are dropped so rephrasings like "what are the X" / "what are X" match
+        vector = np.asarray(self.embeddings.embed_query(" ".join(tokens)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, scope, question):
+        """Return (answer, similarity) for the closest stored question in scope, or None."""
+        tokens = normalize(question)
+        vector = self._embed(tokens)
+        words = polarity(tokens)
+        now = time.time()
+        with self._lock:
+            best, best_score = None, self.threshold
+            for key, (stored, answer, created_at, stored_words) in list(self.entries.items()):
+                if now - created_at > self.ttl:
+                    del self.entries[key]
+                    self.counters["evictions"] += 1
+                    continue
+                if key[0] != scope or stored_words != words:
+                    continue
+                score = float(stored @ vector)
+                if score >= best_score:
+                    best, best_score = key, score
+            if best is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(best)
+            self.counters["hits"] += 1
+            return self.entries[best][1], best_score
+
+    def put(self, scope, question, answer):
+        tokens = normalize(question)
+        vector = self._embed(tokens)
+        with self._lock:
+            key = (scope, " ".join(tokens))
+            self.entries[key] = (vector, answer, time.time(), polarity(tokens))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, policy_area=None):
+        """Drop stored answers for one policy area, or all of them."""
+        with self._lock:
+            for key in [k for k in self.entries if policy_area is None or k[0][0] == policy_area]:
+                del self.entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                "entries": len(self.entries),
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,243 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+import uuid
+
+from analysis import ANALYSIS_MAX_CONCURRENCY, analyze_areas, analyze_sections
+from artifacts import estimate_tokens
+from chains import build_analysis_chain, build_chat_chain, build_section_chain, build_summary_chain, get_llm
+from scheduler import is_rate_limited, llm_scheduler
+from tokens import preflight, usage_config
+from tracing import current_span, span, tracer
+
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "4"))
+# Finished jobs nobody collected (stopped, orphaned by a rerun, or failed before forget) are dropped after this
+SERVICE_JOB_TTL = int(os.getenv("SERVICE_JOB_TTL", "600"))
+
+# Lower runs first: chat replies are interactive, reports can wait
+PRIORITIES = {"chat": 0, "analysis": 1, "sectioned": 2, "multi": 2, "summary": 3}
+FINISHED = ("done", "failed", "cancelled")
+
+
+class Job:
+    """One queued LLM job; fields are written by the service loop and read by the UI."""
+
+    def __init__(self, kind, inputs, priority, options):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.inputs = inputs
+        self.priority = priority
+        self.options = options
+        self.status = "queued"
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.progress = (0, 0)
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+        # Set on cancel; sectioned runs in a worker thread check it before each call
+        self.stop = threading.Event()
+        # The submitting request's span, so the job's spans join its trace
+        self.parent = current_span()
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def snapshot(self):
+        return {
+            "id": self.id, "kind": self.kind, "status": self.status, "progress": self.progress,
+            "chars": sum(len(c) for c in self.chunks), "error": self.error,
+            "queued_seconds": (self.started_at or time.time()) - self.created_at,
+            "run_seconds": ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0,
+        }
+
+
+class LLMService:
+    """In-process async service that owns the LLM client and runs analysis/chat jobs.
+
+    An asyncio loop runs in a daemon thread. Jobs wait in one priority queue
+    and are served by ``workers`` coroutines; every LLM call goes through
+    the process-wide scheduler, so all sessions share the client and the
+    provider's rate limits. The
+    Streamlit script only submits jobs and polls or streams their status.
+    """
+
+    def __init__(self, api_key=None, backend=None, workers=SERVICE_WORKERS, scheduler=llm_scheduler,
+                 job_ttl=SERVICE_JOB_TTL):
+        self.api_key = api_key
+        self.job_ttl = job_ttl
+        self.backend = backend
+        self.scheduler = scheduler
+        self.workers = workers
+        self.jobs = {}
+        self._chains = {}
+        self._sequence = itertools.count()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="llm-service", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.queue = asyncio.PriorityQueue()
+        for _ in range(self.workers):
+            self.loop.create_task(self._worker())
+        self._ready.set()
+        self.loop.run_forever()
+
+    @property
+    def llm(self):
+        # Built on the first job rather than at startup, and shared with any other user of get_llm
+        return get_llm(self.api_key, self.backend)
+
+    def chain(self, kind, cached_content=None):
+        """Chains are built once per (kind, provider cache name) and reused by every job."""
+        key = (kind, cached_content)
+        if key not in self._chains:
+            if kind == "chat":
+                self._chains[key] = build_chat_chain(self.llm, cached_content)
+            elif kind == "analysis":
+                self._chains[key] = build_analysis_chain(self.llm, cached_content)
+            elif kind == "summary":
+                self._chains[key] = build_summary_chain(self.llm)
+            else:
+                self._chains[key] = build_section_chain(self.llm)
+        return self._chains[key]
+
+    def submit(self, kind, inputs, priority=None, **options):
+        """Queue a "chat", "analysis", "sectioned", "multi" or "summary" job and return its id.
+
+        chat/analysis/summary take the chain's inputs (chat/analysis
+        optionally ``cached_content``); sectioned takes ``document_content`` and
+        ``data_path`` (and optionally ``findings_cache``, to reuse the
+        findings of unchanged sections); multi takes ``document_content``
+        and ``areas`` and options like sectioned. ``area`` tags the job's
+        token usage. Prompts over the token limit raise PromptTooLarge
+        here, before being queued.
+        """
+        if kind not in ("sectioned", "multi"):
+            preflight(kind, inputs)
+        self._expire()
+        job = Job(kind, inputs, PRIORITIES[kind] if priority is None else priority, options)
+        self.jobs[job.id] = job
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (job.priority, next(self._sequence), job))
+        return job.id
+
+    def status(self, job_id):
+        return self.jobs[job_id].snapshot()
+
+    def result(self, job_id, timeout=None):
+        """Block until a job finishes and return its text (raises if it failed)."""
+        job = self.jobs[job_id]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while job.status not in FINISHED:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"job {job_id} still {job.status}")
+            time.sleep(0.05)
+        if job.status == "failed":
+            raise RuntimeError(job.error)
+        return job.result if job.result is not None else job.text
+
+    def stream(self, job_id, poll_interval=0.05):
+        """Yield a job's text as it is generated, for st.write_stream."""
+        job = self.jobs[job_id]
+        sent = 0
+        while True:
+            finished = job.status in FINISHED
+            chunks = job.chunks[sent:]
+            sent += len(chunks)
+            yield from chunks
+            if finished:
+                break
+            time.sleep(poll_interval)
+        if job.status == "failed":
+            raise RuntimeError(job.error)
+
+    def cancel(self, job_id):
+        """Stop a job and drop its record; nothing reads a cancelled job's result."""
+        job = self.jobs.pop(job_id, None)
+        if job is None or job.status in FINISHED:
+            return
+        job.stop.set()
+        task = job.task
+        if task is None:
+            job.status = "cancelled"
+        else:
+            self.loop.call_soon_threadsafe(task.cancel)
+
+    def forget(self, job_id):
+        """Drop a finished job's record."""
+        job = self.jobs.get(job_id)
+        if job is not None and job.status in FINISHED:
+            del self.jobs[job_id]
+
+    def _expire(self):
+        cutoff = time.time() - self.job_ttl
+        for job_id, job in list(self.jobs.items()):
+            if job.status in FINISHED and job.finished_at is not None and job.finished_at < cutoff:
+                self.jobs.pop(job_id, None)
+
+    def _estimated_tokens(self, job):
+        return sum(estimate_tokens(str(value)) for value in job.inputs.values())
+
+    async def _execute(self, job):
+        with tracer.attach(job.parent), span(f"llm.{job.kind}", area=job.options.get("area"), job=job.id,
+                                              queued_ms=round((time.time() - job.created_at) * 1000, 1)):
+            await self._run_job(job)
+
+    async def _run_job(self, job):
+        job.status = "running"
+        job.started_at = time.time()
+        if job.kind == "sectioned":
+            # analyze_sections schedules each map call itself; a cancelled job stops waiting for it,
+            # and its stop event keeps the thread from making further calls
+            job.result = await asyncio.to_thread(
+                analyze_sections, self.chain("sectioned"), job.inputs["document_content"],
+                job.inputs["data_path"], job.options.get("max_concurrency", ANALYSIS_MAX_CONCURRENCY),
+                lambda done, total: setattr(job, "progress", (done, total)),
+                area=job.options.get("area"), findings_cache=job.options.get("findings_cache"), stop=job.stop,
+            )
+        elif job.kind == "multi":
+            job.result = await asyncio.to_thread(
+                analyze_areas, self.chain("sectioned"), job.inputs["document_content"], job.inputs["areas"],
+                job.options.get("max_concurrency", ANALYSIS_MAX_CONCURRENCY),
+                lambda done, total: setattr(job, "progress", (done, total)),
+                findings_cache=job.options.get("findings_cache"), stop=job.stop,
+            )
+        else:
+            chain = self.chain(job.kind, job.options.get("cached_content"))
+
+            async def generate():
+                async for chunk in chain.astream(job.inputs, config=usage_config(job.options.get("area"), job.kind)):
+                    job.chunks.append(chunk)
+
+            # A stream is only retried if nothing has been shown to the user yet
+            await self.scheduler.acall(generate, tokens=self._estimated_tokens(job),
+                                       retry_on=lambda e: is_rate_limited(e) and not job.chunks)
+            job.result = job.text
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self.queue.get()
+            if job.status != "queued":
+                continue
+            # The job runs as its own task so cancelling it leaves the worker running
+            job.task = asyncio.ensure_future(self._execute(job))
+            try:
+                await asyncio.wait([job.task])
+                job.task.result()
+                job.status = "done"
+            except asyncio.CancelledError:
+                job.status = "cancelled"
+            except Exception as e:
+                job.status = "failed"
+                job.error = f"{type(e).__name__}: {e}"
+            finally:
+                job.finished_at = time.time()
+                job.task = None
@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Modules app.py imports at startup (app.py itself needs a Streamlit runtime)
+APP_MODULES = [
+    "prompt", "chains", "context_cache", "semantic_cache", "ingest", "analysis", "corpus",
+    "report_cache", "retrieval", "service", "tokens", "tracing",
+]
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(modules):
+    """Import ``modules`` in a fresh interpreter under -X importtime.
+
+    Returns (wall seconds, [(cumulative_us, self_us, depth, module)]).
+    """
+    code = "; ".join(f"import {module}" for module in modules)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    entries = []
+    for line in completed.stderr.splitlines():
+        m = IMPORTTIME_PATTERN.match(line)
+        if m:
+            entries.append((int(m.group(2)), int(m.group(1)), (len(m.group(3)) - 1) // 2, m.group(4)))
+    return wall, entries
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of the app's modules.")
+    parser.add_argument("modules", nargs="*", default=APP_MODULES, help="Modules to import (default: app startup set).")
+    parser.add_argument("--top", type=int, default=15, help="How many of the slowest top-level imports to list.")
+    parser.add_argument("--output", help="Also write the profile as JSON, to compare between versions.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    wall, entries = profile_imports(args.modules)
+    # Depth-0 entries are the imports that were not pulled in by another module
+    top_level = sorted((e for e in entries if e[2] == 0), reverse=True)
+    print(f"Imported {len(args.modules)} module(s) in {wall:.2f}s wall "
+          f"({sum(e[0] for e in top_level) / 1e6:.2f}s in imports, {len(entries)} modules loaded)")
+    for cumulative, _, _, module in top_level[:args.top]:
+        print(f"{cumulative / 1000:10.1f} ms  {module}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "modules": args.modules,
+                "wall_seconds": round(wall, 3),
+                "import_seconds": round(sum(e[0] for e in top_level) / 1e6, 3),
+                "loaded": len(entries),
+                "top": [{"module": module, "cumulative_ms": round(cumulative / 1000, 1)}
+                        for cumulative, _, _, module in top_level[:args.top]],
+            }, f, indent=2)
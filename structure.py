@@ -0,0 +1,287 @@
+import bisect
+import re
+import threading
+from collections import OrderedDict
+
+from artifacts import load_artifact
+from corpus import MAX_CACHED_DOCUMENTS, get_master_document
+
+# Schedules sit beside the chapters of the body, and hold their own Parts and Divisions
+LEVELS = {"act": 0, "chapter": 1, "schedule": 1, "part": 2, "division": 3, "subdivision": 4, "section": 5,
+          "subsection": 6}
+HEADING_PATTERNS = [
+    ("schedule", re.compile(r"^Schedule (\d+[A-Z]*)\s*[—–]\s*(.+)$")),
+    ("chapter", re.compile(r"^Chapter (\d+[A-Z]*)\s*[—–]\s*(.+)$")),
+    ("part", re.compile(r"^Part ([\dIVXLC]+[A-Z]*)\s*[—–]\s*(.+)$")),
+    ("division", re.compile(r"^Division (\d+[A-Z]*)\s*[—–]\s*(.+)$")),
+    ("subdivision", re.compile(r"^Subdivision ([A-Z\d]+)\s*[—–]\s*(.+)$")),
+]
+# A schedule heading can run straight on into its first Part on the same line
+EMBEDDED_PART_PATTERN = re.compile(r"\s+(?=Part [\dIVXLC]+[A-Z]*\s*[—–])")
+CONTENTS_PATTERN = re.compile(r"^(?:Contents|Table of contents)$", re.IGNORECASE)
+PAGE_NUMBER_PATTERN = re.compile(r"\s+\d+$")
+SECTION_PATTERN = re.compile(r"^(\d+)([A-Z]{0,3})\s+([A-Z‘“(][^\n]{0,150})$")
+SUBSECTION_PATTERN = re.compile(r"^\((\d+[A-Z]*)\)\s+\S")
+# Running footers such as "4 Privacy Act 1988" and dates look like section headings
+NOT_HEADING_PATTERN = re.compile(
+    r"\b(?:Act|Regulations?|Bill) \d{4}\s*\d*$"
+    r"|^\d+[A-Z]*\s+(?:January|February|March|April|May|June|July|August|September|October|November|December)\b"
+)
+# Largest jump in section number accepted between consecutive headings
+MAX_SECTION_GAP = 40
+ID_PREFIX = {"chapter": "ch", "schedule": "sch", "part": "pt", "division": "div", "subdivision": "sd"}
+
+
+class Node:
+    """One structural unit of an act, spanning text[start:end]."""
+
+    __slots__ = ("id", "kind", "number", "heading", "start", "end", "parent", "children")
+
+    def __init__(self, id, kind, number, heading, start, end=None, parent=None):
+        self.id = id
+        self.kind = kind
+        self.number = number
+        self.heading = heading
+        self.start = start
+        self.end = end
+        self.parent = parent
+        self.children = []
+
+    @property
+    def level(self):
+        return LEVELS[self.kind]
+
+    @property
+    def label(self):
+        """Human-readable citation, e.g. 's28(1) — Applicable customer identification procedure'."""
+        node = self
+        while node.kind == "subsection" and not node.heading and node.parent is not None:
+            node = node.parent
+        heading = node.heading or self.heading
+        return f"{self.id} — {heading}" if heading else self.id
+
+    def to_dict(self):
+        return {"id": self.id, "kind": self.kind, "number": self.number, "heading": self.heading,
+                "start": self.start, "end": self.end, "parent": self.parent.id if self.parent else None}
+
+
+class ActIndex:
+    """Section tree of one act plus lookups by ID, section number, heading and offset."""
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.root = nodes[0]
+        self.by_id = {node.id: node for node in nodes}
+        # Section numbers refer to the body; schedule clauses are only reachable by ID
+        self.sections = {node.number: node for node in nodes
+                         if node.kind == "section" and not node.id.startswith(ID_PREFIX["schedule"])}
+
+    def get(self, node_id):
+        return self.by_id.get(node_id)
+
+    def section(self, number):
+        """Section node by number, e.g. '28' or '6AA'."""
+        return self.sections.get(str(number).strip().upper())
+
+    def find(self, heading, limit=10):
+        """Nodes whose heading contains the query (case-insensitive), shallowest first."""
+        query = heading.casefold()
+        hits = [node for node in self.nodes[1:] if node.heading and query in node.heading.casefold()]
+        return sorted(hits, key=lambda node: (node.level, node.start))[:limit]
+
+    def node_at(self, offset):
+        """Deepest node whose span contains a character offset."""
+        node = self.root
+        while node.children:
+            starts = [child.start for child in node.children]
+            i = bisect.bisect_right(starts, offset) - 1
+            if i < 0 or offset >= node.children[i].end:
+                break
+            node = node.children[i]
+        return node
+
+    def citation_at(self, offset):
+        """Nearest section-or-coarser node for an offset (subsections roll up)."""
+        node = self.node_at(offset)
+        while node.kind == "subsection":
+            node = node.parent
+        return node
+
+    def to_list(self):
+        return [node.to_dict() for node in self.nodes]
+
+    @classmethod
+    def from_list(cls, items):
+        nodes = []
+        by_id = {}
+        for item in items:
+            node = Node(item["id"], item["kind"], item["number"], item["heading"], item["start"], item["end"])
+            if item["parent"] is not None:
+                node.parent = by_id[item["parent"]]
+                node.parent.children.append(node)
+            by_id[node.id] = node
+            nodes.append(node)
+        return cls(nodes)
+
+
+def _section_key(number, suffix):
+    return int(number), suffix
+
+
+def _heading(line):
+    """(kind, number, heading, rest of line) for a Chapter/Schedule/Part/Division heading, or None."""
+    for kind, pattern in HEADING_PATTERNS:
+        m = pattern.match(line)
+        if m:
+            heading, rest = m.group(2).strip(), None
+            if kind == "schedule":
+                parts = EMBEDDED_PART_PATTERN.split(heading, maxsplit=1)
+                heading, rest = parts[0], parts[1] if len(parts) > 1 else None
+            return kind, m.group(1), heading, rest
+    return None
+
+
+def _is_section_heading(line):
+    return (SECTION_PATTERN.match(line) is not None and not line.endswith((".", ";", ",", ":"))
+            and not NOT_HEADING_PATTERN.search(line))
+
+
+def _contents_span(text):
+    """(start, end) offsets of a table of contents, or None.
+
+    The contents run from a "Contents" line to the first section heading,
+    or to where its first entry reappears as a heading without a page number.
+    """
+    offset = 0
+    start = first = None
+    for raw_line in text.splitlines(keepends=True):
+        line = raw_line.strip()
+        if start is None:
+            if CONTENTS_PATTERN.match(line):
+                start = offset
+        elif _is_section_heading(line) and not PAGE_NUMBER_PATTERN.search(line):
+            # The body may open with sections before its first Part or Schedule
+            return start, offset
+        else:
+            heading = _heading(line)
+            if heading is not None:
+                key = (heading[0], heading[1], PAGE_NUMBER_PATTERN.sub("", heading[2]))
+                if first is None:
+                    first = key
+                elif key == first and not PAGE_NUMBER_PATTERN.search(heading[2]):
+                    return start, offset
+        offset += len(raw_line)
+    return None
+
+
+def parse_act(text, title="act"):
+    """Parse an act's normalised text into an ActIndex of Schedule/Part/Division/Section/subsection nodes.
+
+    Headings in the table of contents are skipped, so each unit's ID comes
+    from its heading in the body.
+    """
+    root = Node("act", "act", None, title, 0, len(text))
+    nodes = [root]
+    stack = [root]
+    used_ids = set()
+    last_section = None
+
+    def open_node(kind, number, heading, start, local_id):
+        while stack[-1].level >= LEVELS[kind]:
+            stack.pop().end = start
+        parent = stack[-1]
+        schedule = next((node for node in stack if node.kind == "schedule"), None)
+        if kind in ("division", "subdivision") and parent.kind != "act":
+            local_id = f"{parent.id}.{local_id}"
+        elif kind in ("part", "section") and schedule is not None:
+            # Schedule clauses and Parts restart their numbering, so they are named within the schedule
+            local_id = f"{schedule.id}.{local_id}"
+        node_id = local_id
+        n = 2
+        while node_id in used_ids:
+            node_id = f"{local_id}~{n}"
+            n += 1
+        used_ids.add(node_id)
+        node = Node(node_id, kind, number, heading, start, parent=parent)
+        parent.children.append(node)
+        nodes.append(node)
+        stack.append(node)
+        return node
+
+    contents = _contents_span(text)
+    offset = 0
+    for raw_line in text.splitlines(keepends=True):
+        line = raw_line.strip()
+        start = offset
+        offset += len(raw_line)
+        if not line or (contents and contents[0] <= start < contents[1]):
+            continue
+
+        heading = _heading(line)
+        if heading is not None:
+            while heading is not None:
+                kind, number, title_text, rest = heading
+                open_node(kind, number, title_text, start, f"{ID_PREFIX[kind]}{number}")
+                if kind == "schedule":
+                    last_section = None
+                heading = _heading(rest) if rest else None
+        else:
+            m = SECTION_PATTERN.match(line)
+            if m and _is_section_heading(line):
+                key = _section_key(m.group(1), m.group(2))
+                if last_section is None or (last_section < key and key[0] - last_section[0] <= MAX_SECTION_GAP):
+                    last_section = key
+                    number = m.group(1) + m.group(2)
+                    open_node("section", number, m.group(3).strip(), start, f"s{number}")
+                    continue
+            m = SUBSECTION_PATTERN.match(line)
+            section = next((node for node in reversed(stack) if node.kind == "section"), None)
+            if m and section is not None:
+                open_node("subsection", m.group(1), None, start, f"{section.id}({m.group(1)})")
+
+    for node in stack:
+        node.end = len(text)
+    return ActIndex(nodes)
+
+
+SECTION_REFERENCE_PATTERN = re.compile(
+    r"\b(?:sections?|subsections?|ss?\.?)\s*(\d+[A-Z]{0,3})((?:\(\d+[A-Z]*\))?)", re.IGNORECASE
+)
+
+
+def cited_sections(text, act_index):
+    """IDs of the act's sections/subsections referenced in a piece of text."""
+    ids = []
+    for number, subsection in SECTION_REFERENCE_PATTERN.findall(text):
+        section = act_index.section(number)
+        if section is None:
+            continue
+        node_id = f"{section.id}{subsection}" if subsection and act_index.get(f"{section.id}{subsection}") else section.id
+        if node_id not in ids:
+            ids.append(node_id)
+    return ids
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_act_index(data_path):
+    """Section tree for a master document, from its artifact or parsed once per version."""
+    document = get_master_document(data_path)
+    key = (document.path, document.version)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    artifact = load_artifact(document.path)
+    index = artifact.structure() if artifact is not None and artifact.version == document.version else None
+    if index is None:
+        index = parse_act(document.text)
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_CACHED_DOCUMENTS:
+            _indexes.popitem(last=False)
+    return index
@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from artifacts import estimate_tokens
+from chains import CHAT_SYSTEM_PROMPT, MODEL_NAME, SECTION_INSTRUCTIONS, SUMMARY_SYSTEM_PROMPT
+from corpus import BASE_DIR
+from prompt import prompt
+
+# Largest prompt sent in one call; gemini-2.0-flash accepts ~1M tokens, minus room for the reply
+PROMPT_TOKEN_LIMIT = int(os.getenv("PROMPT_TOKEN_LIMIT", "900000"))
+USAGE_LOG_PATH = os.getenv("USAGE_LOG_PATH", os.path.join(BASE_DIR, ".usage", "usage.jsonl"))
+
+SYSTEM_PROMPTS = {
+    "analysis": prompt,
+    "chat": CHAT_SYSTEM_PROMPT,
+    "section": prompt + SECTION_INSTRUCTIONS,
+    "summary": SUMMARY_SYSTEM_PROMPT,
+}
+
+
+class PromptTooLarge(ValueError):
+    """A request's estimated prompt exceeds PROMPT_TOKEN_LIMIT."""
+
+    def __init__(self, kind, tokens, limit):
+        super().__init__(f"{kind} prompt is ~{tokens} tokens, over the {limit}-token limit")
+        self.kind = kind
+        self.tokens = tokens
+        self.limit = limit
+
+
+def prompt_tokens(kind, inputs):
+    """Local estimate of the prompt tokens a chain call of ``kind`` will send."""
+    return estimate_tokens(SYSTEM_PROMPTS[kind]) + sum(estimate_tokens(str(v)) for v in inputs.values())
+
+
+def fits(kind, inputs, limit=PROMPT_TOKEN_LIMIT):
+    return prompt_tokens(kind, inputs) <= limit
+
+
+def preflight(kind, inputs, limit=PROMPT_TOKEN_LIMIT):
+    """Return the estimated prompt tokens, raising PromptTooLarge before anything is sent."""
+    tokens = prompt_tokens(kind, inputs)
+    if tokens > limit:
+        raise PromptTooLarge(kind, tokens, limit)
+    return tokens
+
+
+class UsageLog:
+    """Append-only JSON-lines record of prompt/completion tokens per LLM call."""
+
+    def __init__(self, path=USAGE_LOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, **entry):
+        entry = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "model": MODEL_NAME, **entry}
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def entries(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def summary(self):
+        """Totals per (area, kind): calls, prompt and completion tokens."""
+        totals = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        for entry in self.entries():
+            total = totals[(entry.get("area") or "-", entry["kind"])]
+            total["calls"] += 1
+            total["prompt_tokens"] += entry["prompt_tokens"]
+            total["completion_tokens"] += entry["completion_tokens"]
+        return dict(totals)
+
+
+usage_log = UsageLog()
+
+
+class UsageRecorder(BaseCallbackHandler):
+    """Callback that logs each chat model call's token usage.
+
+    Provider-reported counts (``usage_metadata``) are used when present;
+    otherwise both sides are estimated locally and marked as such.
+    """
+
+    def __init__(self, area, kind, log=usage_log):
+        self.area = area
+        self.kind = kind
+        self.log = log
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        text = "".join(str(m.content) for batch in messages for m in batch)
+        self._started[run_id] = (time.perf_counter(), estimate_tokens(text))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started, estimated_prompt = self._started.pop(run_id, (time.perf_counter(), 0))
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        message = getattr(generation, "message", None)
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            prompt_count, completion_count = usage["input_tokens"], usage["output_tokens"]
+        else:
+            prompt_count = estimated_prompt
+            completion_count = estimate_tokens(generation.text if generation else "")
+        self.log.record(area=self.area, kind=self.kind, prompt_tokens=prompt_count,
+                        completion_tokens=completion_count, estimated=not usage,
+                        seconds=round(time.perf_counter() - started, 3))
+
+
+def usage_config(area, kind):
+    """Runnable config that records the call's token usage under (area, kind)."""
+    return {"callbacks": [UsageRecorder(area, kind)]}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Summarise recorded LLM token usage per policy area.")
+    parser.add_argument("--log", default=USAGE_LOG_PATH, help="Usage log to read.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    summary = UsageLog(args.log).summary()
+    print(f"{'Area':<32} {'Kind':<10} {'Calls':>7} {'Prompt':>12} {'Completion':>12}")
+    for (area, kind), total in sorted(summary.items()):
+        print(f"{area:<32} {kind:<10} {total['calls']:>7} {total['prompt_tokens']:>12} {total['completion_tokens']:>12}")
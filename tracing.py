@@ -0,0 +1,151 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+
+# Spans are appended here as JSON lines; set TRACE_LOG_PATH="" to keep them in memory only
+TRACE_LOG_PATH = os.getenv(
+    "TRACE_LOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".traces", "spans.jsonl")
+)
+# The export is rotated to <path>.1 once it reaches this size
+TRACE_LOG_MAX_BYTES = int(os.getenv("TRACE_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+# Recent durations kept per span name for the percentile summary
+TRACE_SAMPLES = int(os.getenv("TRACE_SAMPLES", "1000"))
+TRACE_MAX_TRACES = int(os.getenv("TRACE_MAX_TRACES", "200"))
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage; field names follow the OpenTelemetry span model."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "status")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = "ok"
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id, "name": self.name,
+            "start_ns": self.start_ns, "end_ns": self.end_ns, "duration_ms": round(self.duration_ms, 3),
+            "status": self.status, "attributes": self.attributes,
+        }
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Tracer:
+    """Records spans to a JSON-lines file and keeps per-stage latency samples.
+
+    The file is rotated once it reaches ``max_bytes``, keeping one previous
+    file, so the export stays under about twice that size.
+
+    Spans nest through a context variable, so a span opened inside another
+    (in the same thread or asyncio task) becomes its child. Work handed to
+    another thread continues the trace with ``attach(parent)``.
+    """
+
+    def __init__(self, path=TRACE_LOG_PATH, samples=TRACE_SAMPLES, max_traces=TRACE_MAX_TRACES,
+                 max_bytes=TRACE_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.samples = defaultdict(lambda: deque(maxlen=samples))
+        self.traces = OrderedDict()
+        self.max_traces = max_traces
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = Span(name, _current.get(), attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes["error"] = f"{type(e).__name__}: {e}"[:300]
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current.reset(token)
+            self._finish(span)
+
+    def traced(self, name):
+        """Decorator form of span()."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    @contextmanager
+    def attach(self, parent):
+        """Continue ``parent``'s trace in the current thread or task."""
+        token = _current.set(parent)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def _finish(self, span):
+        with self._lock:
+            self.samples[span.name].append(span.duration_ms)
+            self.traces.setdefault(span.trace_id, []).append(span)
+            self.traces.move_to_end(span.trace_id)
+            while len(self.traces) > self.max_traces:
+                self.traces.popitem(last=False)
+            if self.path:
+                self._export(span)
+
+    def _export(self, span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+            os.replace(self.path, self.path + ".1")
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def trace(self, trace_id):
+        """Finished spans of one trace, in start order."""
+        with self._lock:
+            return sorted(self.traces.get(trace_id, []), key=lambda s: s.start_ns)
+
+    def stats(self):
+        """{span name: {"count", "p50_ms", "p95_ms"}} over the recent samples."""
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self.samples.items()}
+        return {
+            name: {"count": len(values), "p50_ms": round(percentile(values, 0.5), 1),
+                   "p95_ms": round(percentile(values, 0.95), 1)}
+            for name, values in sorted(snapshot.items())
+        }
+
+
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+
+
+def current_span():
+    return _current.get()